@@ -0,0 +1,14 @@
+# Benchmarks do gerador de escalas
+# ------------------------------------------------------------
+# Payloads sintéticos (sem nomes reais) + cenários cronometrados do motor,
+# mês, ano e parecer, com relatório JSON para comparar antes do deploy.
+#
+# Uso (de dentro de googlefunctions/escalatorre):
+#   python -m benchmarks                          # roda e imprime o relatório
+#   python -m benchmarks --saida base.json        # grava o relatório
+#   python -m benchmarks --comparar base.json     # falha (exit 1) se regrediu
+
+from .payload import gerar_payload
+from .cenarios import CENARIOS, rodar_benchmarks, comparar_relatorios
+
+__all__ = ["gerar_payload", "CENARIOS", "rodar_benchmarks", "comparar_relatorios"]
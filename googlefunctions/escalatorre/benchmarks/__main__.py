@@ -0,0 +1,52 @@
+import argparse
+import json
+import sys
+
+from .cenarios import CENARIOS, PLANO_PADRAO, comparar_relatorios, rodar_benchmarks
+
+
+def _plano(args):
+    if not args.cenarios and not args.operadores:
+        return PLANO_PADRAO
+    nomes = args.cenarios.split(",") if args.cenarios else list(CENARIOS)
+    tamanhos = [int(n) for n in args.operadores.split(",")] if args.operadores else [16]
+    return [
+        (nome, n, "ano" if nome in ("ano", "parecer") else "mes", args.tentativas)
+        for n in sorted(tamanhos) for nome in nomes
+    ]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks do gerador de escalas")
+    ap.add_argument("--cenarios", help=f"lista separada por vírgula ({', '.join(CENARIOS)})")
+    ap.add_argument("--operadores", help="tamanhos de equipe, ex.: 16,48,120")
+    ap.add_argument("--tentativas", type=int, default=100)
+    ap.add_argument("--processos", type=int, default=1)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--saida", help="grava o relatório JSON neste arquivo")
+    ap.add_argument("--comparar", help="relatório base; sai com código 1 se houver regressão")
+    ap.add_argument("--tolerancia", type=float, default=0.2)
+    args = ap.parse_args(argv)
+
+    # logs do motor vão para stderr; stdout fica só com o JSON
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    try:
+        relatorio = rodar_benchmarks(_plano(args), seed=args.seed, processos=args.processos,
+                                     log=lambda msg: print(msg, file=sys.stderr))
+    finally:
+        sys.stdout = stdout
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as fh:
+            relatorio["regressoes"] = comparar_relatorios(json.load(fh), relatorio, args.tolerancia)
+
+    texto = json.dumps(relatorio, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as fh:
+            fh.write(texto)
+    print(texto)
+    return 1 if relatorio.get("regressoes") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
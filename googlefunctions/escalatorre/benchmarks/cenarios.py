@@ -0,0 +1,195 @@
+"""
+Cenários cronometrados e relatório JSON.
+
+Cada cenário recebe (payload, repeticoes) e devolve métricas próprias; o
+runner acrescenta tempo total e o pico de RSS do processo (high-water mark
+de resource.getrusage, então os cenários rodam do menor para o maior).
+
+    motor     → motor_gerar_dias_mes de um mês: tentativas/s e podas
+    vetorizado→ idem com parametros.motor = "vetorizado"
+    mes       → gerar_escala_mes ponta a ponta (motor + parecer + saída)
+    ano       → gerar_escala_ano: latência de cada mês
+    parecer   → gerar_parecer_escala sobre os dias de um ano gerado
+"""
+
+import os
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main as escala  # noqa: E402
+
+from .payload import gerar_payload  # noqa: E402
+
+
+def _pico_rss_mb():
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KiB, macOS em bytes
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _argumentos(payload):
+    ano, mes, funcionarios, params, info, kw = escala._parametros_payload(payload)
+    validos = [f for f in funcionarios if f.get("perfil") in ("EXP", "AUX")]
+    return ano, mes, validos, params, info, kw
+
+
+# ---------- CENÁRIOS ----------
+
+def cenario_motor(payload, repeticoes=1):
+    ano, mes, funcionarios, params, info, kw = _argumentos(payload)
+    tentativas = podas = 0
+    t0 = time.perf_counter()
+    for _ in range(repeticoes):
+        res = escala.motor_gerar_dias_mes(
+            ano, mes, funcionarios, params, info, FLEXIBILIZAR=kw["FLEXIBILIZAR"],
+            tentativas=kw["tentativas"], processos=kw["processos"], tempo_limite_ms=kw["tempo_limite_ms"])
+        tentativas += res["tentativas_realizadas"]
+        podas += res["podas"]["total"]
+    seg = time.perf_counter() - t0
+    return {
+        "segundos": seg,
+        "tentativas": tentativas,
+        "tentativas_por_s": tentativas / seg if seg else None,
+        "podas": podas,
+        "score": res["score"],
+    }
+
+
+def cenario_vetorizado(payload, repeticoes=1):
+    payload = {**payload, "parametros": {**payload["parametros"], "motor": "vetorizado"}}
+    return cenario_motor(payload, repeticoes)
+
+
+def cenario_mes(payload, repeticoes=1):
+    ano, mes, funcionarios, params, info, kw = _argumentos(payload)
+    lat = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        res = escala.gerar_escala_mes(ano, mes, funcionarios, params, info, **kw)
+        lat.append(time.perf_counter() - t0)
+    return {
+        "segundos": sum(lat),
+        "latencia_mes_ms": round(1000 * float(np.median(lat)), 1),
+        "tentativas_por_s": res["tentativas_realizadas"] / float(np.median(lat)),
+        "score": res["score"],
+    }
+
+
+def cenario_ano(payload, repeticoes=1):
+    ano, mes, funcionarios, params, info, kw = _argumentos(payload)
+    marcas = []
+
+    def ao_concluir_mes(chave, res):
+        marcas.append((chave, time.perf_counter(), res["tentativas_realizadas"]))
+
+    t0 = time.perf_counter()
+    escala.gerar_escala_ano(ano, mes, funcionarios, params, info, ao_concluir_mes=ao_concluir_mes, **kw)
+    seg = time.perf_counter() - t0
+
+    por_mes, anterior = {}, t0
+    for chave, t, _ in marcas:
+        por_mes[chave] = round(1000 * (t - anterior), 1)
+        anterior = t
+    return {
+        "segundos": seg,
+        "latencia_por_mes_ms": por_mes,
+        "latencia_mes_ms": round(float(np.median(list(por_mes.values()))), 1) if por_mes else None,
+        "tentativas_por_s": sum(m[2] for m in marcas) / seg if seg else None,
+    }
+
+
+def cenario_parecer(payload, repeticoes=20):
+    ano, mes, funcionarios, params, info, kw = _argumentos(payload)
+    res = escala.gerar_escala_ano(ano, mes, funcionarios, params, info, **{**kw, "tentativas": 1})
+    meses = [m["dias"] for m in res["escala"].values()]
+    t0 = time.perf_counter()
+    for _ in range(repeticoes):
+        for dias in meses:
+            escala.gerar_parecer_escala(dias, funcionarios)
+    seg = time.perf_counter() - t0
+    return {
+        "segundos": seg,
+        "latencia_mes_ms": round(1000 * seg / (repeticoes * len(meses)), 3),
+    }
+
+
+CENARIOS = {
+    "motor":      cenario_motor,
+    "vetorizado": cenario_vetorizado,
+    "mes":        cenario_mes,
+    "ano":        cenario_ano,
+    "parecer":    cenario_parecer,
+}
+
+# (cenário, tamanho da equipe, tipo, tentativas) — do menor para o maior
+PLANO_PADRAO = [
+    ("parecer",    16,  "ano", 1),
+    ("motor",      16,  "mes", 200),
+    ("vetorizado", 16,  "mes", 2048),
+    ("mes",        16,  "mes", 200),
+    ("motor",      120, "mes", 50),
+    ("ano",        16,  "ano", 50),
+]
+
+
+def rodar_benchmarks(plano=None, seed=0, processos=1, log=print):
+    plano = plano or PLANO_PADRAO
+    resultados = []
+    for nome, n, tipo, tentativas in plano:
+        payload = gerar_payload(n_operadores=n, tipo=tipo, seed=seed,
+                                quantidade_escalas=tentativas, processos=processos, cache=False)
+        log(f"[benchmark] {nome} n={n} tentativas={tentativas} ...")
+        metricas = CENARIOS[nome](payload)
+        metricas["pico_rss_mb"] = _pico_rss_mb()
+        resultados.append({
+            "cenario": nome,
+            "chave": f"{nome}/n{n}/t{tentativas}",
+            "operadores": n,
+            "tentativas": tentativas,
+            **{k: (round(v, 3) if isinstance(v, float) else v) for k, v in metricas.items()},
+        })
+    return {
+        "ambiente": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "processos": processos,
+            "seed": seed,
+        },
+        "quando": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cenarios": resultados,
+    }
+
+
+def comparar_relatorios(base, atual, tolerancia=0.2):
+    """
+    Regressões de `atual` contra `base` (mesma chave de cenário): queda de
+    tentativas/s ou aumento de latência acima de `tolerancia`.
+    """
+    anteriores = {c["chave"]: c for c in base["cenarios"]}
+    regressoes = []
+    for c in atual["cenarios"]:
+        b = anteriores.get(c["chave"])
+        if not b:
+            continue
+        if b.get("tentativas_por_s") and c.get("tentativas_por_s") is not None \
+                and c["tentativas_por_s"] < b["tentativas_por_s"] * (1 - tolerancia):
+            regressoes.append({"chave": c["chave"], "metrica": "tentativas_por_s",
+                               "base": b["tentativas_por_s"], "atual": c["tentativas_por_s"]})
+        if b.get("latencia_mes_ms") and c.get("latencia_mes_ms") is not None \
+                and c["latencia_mes_ms"] > b["latencia_mes_ms"] * (1 + tolerancia):
+            regressoes.append({"chave": c["chave"], "metrica": "latencia_mes_ms",
+                               "base": b["latencia_mes_ms"], "atual": c["latencia_mes_ms"]})
+    return regressoes
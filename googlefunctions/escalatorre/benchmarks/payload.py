@@ -0,0 +1,82 @@
+"""
+Gerador de payloads sintéticos no mesmo formato do POST de main(request).
+
+    gerar_payload(n_operadores=16, proporcao_exp=0.5,
+                  densidade_ferias=0.08, densidade_restricoes=0.25, ...)
+
+  • densidade_ferias     → fração dos dias-operador do ano em férias, em
+                           blocos contínuos de 10 a 30 dias
+  • densidade_restricoes → fração dos operadores com alguma restrição
+                           (turno proibido, dia da semana proibido, datas
+                           proibidas ou turnos permitidos por dia)
+
+Tudo sai de random.Random(seed): o mesmo seed dá o mesmo payload.
+"""
+
+import random
+from datetime import date, timedelta
+
+TURNOS = ["00H", "06H", "12H", "18H"]
+
+
+def _ferias(rng, fids, ano, densidade):
+    dias_ano = (date(ano, 12, 31) - date(ano, 1, 1)).days + 1
+    alvo = int(len(fids) * dias_ano * densidade)
+    ferias, total = [], 0
+    while total < alvo:
+        dur = rng.randint(10, 30)
+        ini = date(ano, 1, 1) + timedelta(days=rng.randrange(dias_ano - dur))
+        ferias.append({
+            "funcionario_id": rng.choice(fids),
+            "data_inicio": ini.isoformat(),
+            "data_fim": (ini + timedelta(days=dur - 1)).isoformat(),
+        })
+        total += dur
+    return ferias
+
+
+def _restricoes(rng, fids, ano, densidade):
+    out = []
+    for fid in rng.sample(fids, int(round(len(fids) * densidade))):
+        tipo = rng.choice(["TURNO_PROIBIDO", "DIA_SEMANA_PROIBIDO", "DATA_PROIBIDA", "TURNO_PERMITIDO_POR_DIA"])
+        r = {"funcionario_id": fid, "tipo": tipo}
+        if tipo == "TURNO_PROIBIDO":
+            r["turno"] = rng.choice(TURNOS)
+        elif tipo == "DIA_SEMANA_PROIBIDO":
+            r["dia_semana"] = rng.randrange(7)
+        elif tipo == "DATA_PROIBIDA":
+            r["data"] = (date(ano, 1, 1) + timedelta(days=rng.randrange(365))).isoformat()
+        else:
+            r["dia_semana"] = rng.randrange(7)
+            r["turnos_permitidos"] = ",".join(rng.sample(TURNOS, 2))
+        out.append(r)
+    return out
+
+
+def gerar_payload(n_operadores=16, proporcao_exp=0.5, densidade_ferias=0.08,
+                  densidade_restricoes=0.25, densidade_preferencias=0.25,
+                  ano=2026, mes_inicio=1, tipo="mes", seed=0, **parametros):
+    """Payload completo; `parametros` vai para payload["parametros"]."""
+    rng = random.Random(f"benchmark-{seed}")
+    n_exp = int(round(n_operadores * proporcao_exp))
+    perfis = ["EXP"] * n_exp + ["AUX"] * (n_operadores - n_exp)
+    rng.shuffle(perfis)
+    funcionarios = [
+        {"id": i + 1, "nome": f"OP{i + 1:03d}", "perfil": perfil}
+        for i, perfil in enumerate(perfis)
+    ]
+    fids = [f["id"] for f in funcionarios]
+    preferencias = [
+        {"funcionario_id": fid, "turnos_preferidos": rng.sample(TURNOS, 1)}
+        for fid in rng.sample(fids, int(round(n_operadores * densidade_preferencias)))
+    ]
+    return {
+        "ano": ano,
+        "mes_inicio": mes_inicio,
+        "tipo": tipo,
+        "funcionarios": funcionarios,
+        "ferias": _ferias(rng, fids, ano, densidade_ferias),
+        "restricoes": _restricoes(rng, fids, ano, densidade_restricoes),
+        "preferencias": preferencias,
+        "parametros": {"seed": seed, **parametros},
+    }
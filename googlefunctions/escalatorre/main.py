@@ -12,11 +12,27 @@
 
 import json
 import calendar
+import cProfile
+import gzip
+import hashlib
 import random
 import statistics
 import math
+import os
+import pstats
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, nullcontext
+from heapq import heapify, heappop
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 
+import numpy as np
+
 HORAS_POR_TURNO = 6  # usado fora do motor (parecer)
 
 
@@ -89,7 +105,7 @@ Entradas:
 
 Saídas:
     {
-        "dias":      dias_mes_raw,   # lista de dicionários com objetos funcionário
+        "escala":    EscalaArray,    # (dias, turnos, vagas) de índices em funcionarios
         "horas":     dict {fid: int},
         "stats":     dict {fid: {turno: cont}},
         "dias_trab": dict {fid: int},
@@ -157,22 +173,25 @@ def limite_consecutivo(dia_corrente):
 
 
 # ---------- HARD CONSTRAINTS ----------
-# (inalterado)
 
 def restricoes_hard(fid, turno, data, info, consec, ultimo_turno, stats):
-    if any(s <= data <= e for s, e in info["ferias"].get(fid, [])):
-        return False
+    livre = disponibilidade_em(info.get("disponibilidade"), fid, turno, data)
+    if livre is None:
+        if any(s <= data <= e for s, e in info["ferias"].get(fid, [])):
+            return False
 
-    rst, wd = info["restricoes"], data.weekday()
-    if wd in rst["dia_semana_proibido"].get(fid, set()):
-        return False
-    if turno in rst["turno_proibido"].get(fid, set()):
-        return False
-    if data in rst["data_proibida"].get(fid, set()):
-        return False
-    if wd in rst["turno_permitido_por_dia"].get(fid, {}):
-        if turno not in rst["turno_permitido_por_dia"][fid][wd]:
+        rst, wd = info["restricoes"], data.weekday()
+        if wd in rst["dia_semana_proibido"].get(fid, set()):
+            return False
+        if turno in rst["turno_proibido"].get(fid, set()):
             return False
+        if data in rst["data_proibida"].get(fid, set()):
+            return False
+        if wd in rst["turno_permitido_por_dia"].get(fid, {}):
+            if turno not in rst["turno_permitido_por_dia"][fid][wd]:
+                return False
+    elif not livre:
+        return False
 
     ut, cons = ultimo_turno.get(fid), consec[fid]
     if cons > 0 and ut != turno:
@@ -187,6 +206,219 @@ def restricoes_hard(fid, turno, data, info, consec, ultimo_turno, stats):
     return True
 
 
+# ---------- DISPONIBILIDADE COMPILADA (operador × dia × turno) ----------
+"""
+Férias e restrições não mudam durante a geração, então são compiladas uma
+única vez num tensor booleano denso:
+
+    livre[i, d, t]  → operador i pode trabalhar no dia d (desde `inicio`) no turno t
+    ferias[i, d]    → operador i está de férias no dia d
+
+O motor só indexa; ninguém mais varre listas de férias ou sets de restrições
+por candidato. Pode ser compilado para um mês ou para o restante do ano
+(gerar_escala_ano/main) e fatiado por mês sem cópia.
+"""
+
+IDX_TURNO = {t: k for k, t in enumerate(TURNOS)}
+
+# Turnos como índices 0..3 (ordem de TURNOS); -1 = sem turno
+SEM_TURNO = -1
+PROX_TURNO = [IDX_TURNO[CICLO_TURNOS[t]] for t in TURNOS]
+
+
+def compilar_disponibilidade(funcionarios, info, inicio, fim):
+    """Compila `info` (parse_ferias/parse_restricoes) no intervalo [inicio, fim]."""
+    fids = [str(f["id"]) for f in funcionarios]
+    n_dias = (fim - inicio).days + 1
+    livre = np.ones((len(fids), n_dias, len(TURNOS)), dtype=bool)
+    ferias = np.zeros((len(fids), n_dias), dtype=bool)
+
+    # weekday de cada dia do intervalo (0 = segunda)
+    dias_semana = (np.arange(n_dias) + inicio.weekday()) % 7
+    rst = info["restricoes"]
+
+    for i, fid in enumerate(fids):
+        for ini, fim_f in info["ferias"].get(fid, []):
+            a = max((ini - inicio).days, 0)
+            b = min((fim_f - inicio).days, n_dias - 1)
+            if a <= b:
+                ferias[i, a:b + 1] = True
+
+        for wd in rst["dia_semana_proibido"].get(fid, set()):
+            livre[i, dias_semana == wd, :] = False
+        for turno in rst["turno_proibido"].get(fid, set()):
+            if turno in IDX_TURNO:
+                livre[i, :, IDX_TURNO[turno]] = False
+        for data in rst["data_proibida"].get(fid, set()):
+            d = (data - inicio).days
+            if 0 <= d < n_dias:
+                livre[i, d, :] = False
+        for wd, permitidos in rst["turno_permitido_por_dia"].get(fid, {}).items():
+            proibidos = [IDX_TURNO[t] for t in TURNOS if t not in permitidos]
+            if proibidos:
+                livre[np.ix_([i], np.flatnonzero(dias_semana == wd), proibidos)] = False
+
+    livre &= ~ferias[:, :, None]
+    return {
+        "inicio": inicio,
+        "fim": fim,
+        "pos": {fid: i for i, fid in enumerate(fids)},
+        "livre": livre,
+        "ferias": ferias,
+    }
+
+
+def disponibilidade_em(disp, fid, turno, data):
+    """Consulta pontual; None se o tensor não cobre (fid, data)."""
+    if disp is None or not (disp["inicio"] <= data <= disp["fim"]):
+        return None
+    i = disp["pos"].get(fid)
+    if i is None:
+        return None
+    return bool(disp["livre"][i, (data - disp["inicio"]).days, IDX_TURNO[turno]])
+
+
+def disponibilidade_mes(funcionarios, info, ano, mes):
+    """
+    Fatia mensal (listas aninhadas, [i][dia-1][t] / [i][dia-1]) na ordem de
+    `funcionarios`. Reaproveita o tensor anual de `info` quando ele cobre o mês.
+    """
+    inicio = datetime(ano, mes, 1).date()
+    fim = datetime(ano, mes, dias_do_mes(ano, mes)).date()
+    disp = info.get("disponibilidade")
+    fids = [str(f["id"]) for f in funcionarios]
+    if disp is None or not (disp["inicio"] <= inicio and fim <= disp["fim"]) \
+            or any(fid not in disp["pos"] for fid in fids):
+        disp = compilar_disponibilidade(funcionarios, info, inicio, fim)
+
+    a = (inicio - disp["inicio"]).days
+    b = a + (fim - inicio).days + 1
+    linhas = [disp["pos"][fid] for fid in fids]
+    return disp["livre"][linhas, a:b].tolist(), disp["ferias"][linhas, a:b].tolist()
+
+
+# ---------- ESCALA COMPACTA (EscalaArray) ----------
+"""
+Representação única de uma escala pronta em todo o pipeline (motor,
+parecer, resumo anual, formato compacto, estado contínuo): um array int16
+(dias, turnos, vagas) com índices em `funcionarios`, -1 nas vagas vazias,
+mais as datas de cada dia. Nomes e objetos funcionário só aparecem na
+borda (to_json / to_rows).
+"""
+
+
+class EscalaArray:
+    __slots__ = ("dados", "funcionarios", "datas")
+
+    def __init__(self, dados, funcionarios, datas):
+        self.dados = dados                  # np.int16 (dias, len(TURNOS), vagas)
+        self.funcionarios = funcionarios
+        self.datas = list(datas)            # "AAAA-MM-DD" por dia
+
+    # ---- construção ----
+    @classmethod
+    def de_grade(cls, grade, funcionarios, datas):
+        """`grade[dia][t]` = lista de índices (formato do motor)."""
+        vagas = max((len(dupla) for linha in grade for dupla in linha), default=0)
+        dados = np.full((len(grade), len(TURNOS), max(vagas, 1)), -1, dtype=np.int16)
+        for d, linha in enumerate(grade):
+            for t, dupla in enumerate(linha):
+                dados[d, t, :len(dupla)] = dupla
+        return cls(dados, funcionarios, datas)
+
+    @classmethod
+    def from_json(cls, dias, funcionarios):
+        """
+        `dias` no formato da resposta ({"data", "turnos": {turno: [...]}}) ou o
+        dict do mês que os contém. Pessoas por nome (o primeiro funcionário
+        com o nome vence) ou {"funcionario_id": ...}; desconhecidas são ignoradas.
+        """
+        if isinstance(dias, dict):
+            dias = dias.get("dias") or []
+        idx_nome, idx_id = {}, {}
+        for i, f in enumerate(funcionarios):
+            idx_nome.setdefault(f.get("nome"), i)
+            idx_id.setdefault(str(f["id"]), i)
+
+        def indice(p):
+            if isinstance(p, dict) and "funcionario_id" in p:
+                return idx_id.get(str(p["funcionario_id"]))
+            if isinstance(p, str):
+                return idx_nome.get(p)
+            return None
+
+        grade = []
+        for dia in dias:
+            linha = [[] for _ in TURNOS]
+            for turno, pessoas in dia["turnos"].items():
+                linha[IDX_TURNO[turno]].extend(i for i in map(indice, pessoas) if i is not None)
+            grade.append(linha)
+        return cls.de_grade(grade, funcionarios, [d.get("data") for d in dias])
+
+    @classmethod
+    def concatenar(cls, escalas):
+        """Junta meses consecutivos (mesmos funcionários) num período só."""
+        if not escalas:
+            return cls(np.full((0, len(TURNOS), 1), -1, dtype=np.int16), [], [])
+        vagas = max(e.dados.shape[2] for e in escalas)
+        dados = np.full((sum(len(e) for e in escalas), len(TURNOS), vagas), -1, dtype=np.int16)
+        d = 0
+        for e in escalas:
+            dados[d:d + len(e), :, :e.dados.shape[2]] = e.dados
+            d += len(e)
+        return cls(dados, escalas[0].funcionarios, [x for e in escalas for x in e.datas])
+
+    # ---- visões (sem cópia, exceto operador/ocupacao) ----
+    def __len__(self):
+        return self.dados.shape[0]
+
+    def dia(self, d):
+        """(turnos, vagas) do dia `d` (0-based)."""
+        return self.dados[d]
+
+    def turno(self, t):
+        """(dias, vagas) do turno `t` (índice ou nome)."""
+        return self.dados[:, IDX_TURNO.get(t, t)]
+
+    def operador(self, i):
+        """
+        (dias, turnos) bool: onde o operador `i` trabalhou. Não é visão:
+        a máscara é calculada (uma cópia nova a cada chamada).
+        """
+        return (self.dados == i).any(2)
+
+    def ocupacao(self):
+        """(dias * turnos, n) bool: uma coluna por operador (vetorização)."""
+        n = len(self.funcionarios)
+        dias, turnos, vagas = self.dados.shape
+        X = np.zeros((dias * turnos, n + 1), dtype=bool)
+        X[np.repeat(np.arange(dias * turnos), vagas), self.dados.reshape(-1)] = True   # -1 → coluna n
+        return X[:, :n]
+
+    # ---- conversões ----
+    def listas(self):
+        """Volta ao formato do motor: [dia][t] = lista de índices."""
+        return [[[int(i) for i in vagas if i >= 0] for vagas in linha] for linha in self.dados.tolist()]
+
+    def to_json(self):
+        """`dias` da resposta: [{"data", "turnos": {turno: [nomes]}}]."""
+        nomes = [f["nome"] for f in self.funcionarios]
+        return [
+            {"data": data, "turnos": {turno: [nomes[i] for i in vagas if i >= 0]
+                                      for turno, vagas in zip(TURNOS, linha)}}
+            for data, linha in zip(self.datas, self.dados.tolist())
+        ]
+
+    def to_rows(self):
+        """Uma linha por alocação: (data, turno, vaga, funcionario_id, nome)."""
+        d, t, v = np.nonzero(self.dados >= 0)
+        return [
+            (self.datas[a], TURNOS[b], int(c) + 1,
+             self.funcionarios[self.dados[a, b, c]]["id"], self.funcionarios[self.dados[a, b, c]].get("nome"))
+            for a, b, c in zip(d.tolist(), t.tolist(), v.tolist())
+        ]
+
+
 # ---------- SOFT SCORE ----------
 # (inalterado)
 
@@ -259,6 +491,175 @@ def score_func(params, func, turno, horas, consec, dia, prefs,
     return s + random.uniform(-1, 1)
 
 
+# ---------- PONTUADOR INCREMENTAL ----------
+"""
+Agregados corridos do modelo de score, em vez de recontar a cada consulta.
+Tudo tem um eixo de tentativas na frente (linha a, operador i), para servir
+o motor vetorizado (A tentativas) e a otimização local (uma só, linha 0):
+
+  por operador  horas, dias no mês, dias na semana, dias por turno e total
+                de turnos, último parceiro
+  por linha     soma e soma dos quadrados das horas (variancia); para o
+                score de horas, um histograma horas → quantos operadores com
+                o max/min atuais, montado só quando delta_score/aplicar_horas
+                são usados
+
+  custo(suave, t, ...)    → termos SOFT_WEIGHTS de alocar cada operador no
+                            turno t (o score_func sem ruído, ver PONTUAÇÃO
+                            SUAVE), O(1) por candidato
+  atribuir / parear / nova_semana / fechar_dia → atualizam os agregados
+                            durante a escolha gulosa
+  delta_score({i: dh})    → variação do score de horas, (max - min) + média
+                            / 5, se h[i] += dh, sem aplicar
+  aplicar_horas / mover   → aplicam um movimento da otimização local
+
+delta_score custa O(len(mudancas)), mais O(valores distintos de horas)
+quando um movimento esvazia o max ou o min atual e é preciso achar o
+seguinte no histograma (horas são múltiplos de HORAS_POR_TURNO, então
+são poucos valores).
+"""
+
+
+class PontuadorIncremental:
+    def __init__(self, fids, horas=None, tentativas=1, dias=None, por_turno=None):
+        self.fids = list(fids)
+        n = len(self.fids)
+
+        def linha(valores, padrao=0):
+            return [(valores or {}).get(fid, padrao) for fid in self.fids]
+
+        self.h = np.tile(np.array(linha(horas), dtype=np.int64).reshape(1, n), (tentativas, 1))
+        self.dias_mes = np.tile(np.array(linha(dias), dtype=np.int32).reshape(1, n), (tentativas, 1))
+        turnos = np.array(linha(por_turno, [0] * len(TURNOS)), dtype=np.int32).reshape(1, n, len(TURNOS))
+        self.por_turno = np.tile(turnos, (tentativas, 1, 1))
+        self.total_turnos = self.por_turno.sum(2)
+        self.semana = np.zeros((tentativas, n), dtype=np.int32)
+        self.parceiro_ult = np.full((tentativas, n), -1, dtype=np.int32)
+        self.soma = self.h.sum(1)
+        self.soma_q = (self.h ** 2).sum(1)
+        self._hist = {}   # linha → [Counter de horas, max, min]
+
+    # ---- score de horas do motor ----
+    def _histograma(self, a):
+        if a not in self._hist:
+            hist = Counter(self.h[a].tolist())
+            self._hist[a] = [hist, max(hist, default=0), min(hist, default=0)]
+        return self._hist[a]
+
+    def score(self, a=0):
+        n = len(self.fids)
+        _, maximo, minimo = self._histograma(a)
+        return (maximo - minimo) + int(self.soma[a]) / n / 5 if n else float("inf")
+
+    def variancia(self, a=0):
+        n = len(self.fids)
+        return int(self.soma_q[a]) / n - (int(self.soma[a]) / n) ** 2 if n else 0.0
+
+    def _extremos_sem(self, a, saem):
+        """max/min do histograma da linha `a` descontando os valores em `saem` (Counter)."""
+        hist, maximo, minimo = self._histograma(a)
+
+        def vivo(v):
+            return hist[v] - saem.get(v, 0) > 0
+        maximo = maximo if vivo(maximo) else max((v for v in hist if vivo(v)), default=None)
+        minimo = minimo if vivo(minimo) else min((v for v in hist if vivo(v)), default=None)
+        return maximo, minimo
+
+    def delta_score(self, mudancas, a=0):
+        """Variação de score(a) se h[a, i] += dh para cada (i, dh) de `mudancas`."""
+        mudancas = {i: dh for i, dh in mudancas.items() if dh}
+        if not mudancas:
+            return 0
+        h = self.h[a]
+        saem = Counter(int(h[i]) for i in mudancas)
+        novos = [int(h[i]) + dh for i, dh in mudancas.items()]
+        _, maximo_ant, minimo_ant = self._histograma(a)
+        maximo, minimo = self._extremos_sem(a, saem)
+        maximo = max(novos) if maximo is None else max(maximo, max(novos))
+        minimo = min(novos) if minimo is None else min(minimo, min(novos))
+        n = len(self.fids)
+        return ((maximo - minimo) - (maximo_ant - minimo_ant)) + sum(mudancas.values()) / n / 5
+
+    def aplicar_horas(self, mudancas, a=0):
+        saem, entram = Counter(), Counter()
+        h = self.h[a]
+        for i, dh in mudancas.items():
+            if not dh:
+                continue
+            antes = int(h[i])
+            saem[antes] += 1
+            entram[antes + dh] += 1
+            h[i] = antes + dh
+            self.soma[a] += dh
+            self.soma_q[a] += (antes + dh) ** 2 - antes ** 2
+        if not saem:
+            return
+        maximo, minimo = self._extremos_sem(a, saem)
+        hist = self._hist[a]
+        hist[0].subtract(saem)
+        hist[0].update(entram)
+        for v in saem:
+            if hist[0][v] <= 0:
+                del hist[0][v]
+        hist[1] = max(entram) if maximo is None else max(maximo, max(entram))
+        hist[2] = min(entram) if minimo is None else min(minimo, min(entram))
+
+    def mover(self, t, sai, entra, a=0):
+        """Uma vaga do turno `t` passa de `sai` para `entra` (horas à parte, em aplicar_horas)."""
+        for i, passo in ((sai, -1), (entra, 1)):
+            self.por_turno[a, i, t] += passo
+            self.total_turnos[a, i] += passo
+            self.dias_mes[a, i] += passo
+
+    # ---- escolha gulosa (todas as linhas de uma vez) ----
+    def custo(self, suave, t, dia, meta_semana, parceiro):
+        """
+        Custo (A, n) de alocar cada operador no turno `t`; `suave` de
+        _preparar_pontuacao_suave, `parceiro` (A,) com -1 quando a vaga
+        ainda não tem par.
+        """
+        no_turno = self.por_turno[:, :, t]
+        total = self.total_turnos
+        alvo = np.where(total > 0, (total + 1) / 4, 0.25)
+        s = SOFT_WEIGHTS["balanceamento_turnos"] * (no_turno + 1 - alvo) ** 2
+        if dia >= 10:
+            s += SOFT_WEIGHTS["penaliza_ausencia_turno"] * (no_turno == 0)
+        limite = HARD_RULES["limite_dias_mesmo_turno"]
+        s += np.where(no_turno >= limite, 120 + 40 * (no_turno - limite), 0)
+        s += SOFT_WEIGHTS["preferencia_turno"] * suave["pref"][:, t]
+        s += np.where(self.semana >= meta_semana, 5000, np.where(self.semana == meta_semana - 1, 800, 0))
+        if dia <= START_WINDOW_DIAS:
+            s += suave["penalidade_start"] * 800
+        if SOFT_WEIGHTS["penaliza_parceiro_repetido"]:
+            s += SOFT_WEIGHTS["penaliza_parceiro_repetido"] * \
+                ((self.parceiro_ult == parceiro[:, None]) & (parceiro >= 0)[:, None])
+        s += (self.h / 10) * SOFT_WEIGHTS["desequilibrio_horas"]
+        s += np.abs(self.dias_mes + 1 - 21) * 45
+        return s
+
+    def atribuir(self, a, i, t):
+        """Operadores `i` das linhas `a` (um por linha) alocados no turno `t`."""
+        self.por_turno[a, i, t] += 1
+        self.total_turnos[a, i] += 1
+
+    def parear(self, a, i, par):
+        self.parceiro_ult[a, i] = par
+        self.parceiro_ult[a, par] = i
+
+    def nova_semana(self):
+        self.semana[:] = 0
+
+    def fechar_dia(self, trab):
+        """`trab` (A, n): quem trabalhou hoje; soma o dia às horas e contagens."""
+        dh = trab * HORAS_POR_TURNO
+        self.soma_q += ((self.h + dh) ** 2 - self.h ** 2).sum(1)
+        self.soma += dh.sum(1)
+        self.h += dh
+        self.dias_mes += trab
+        self.semana += trab
+        self._hist.clear()
+
+
 # ---------- ESCOLHA DO FUNCIONÁRIO (ajuste de fallback seguro) ----------
 # (inalterado)
 
@@ -350,621 +751,2915 @@ def escolher_dupla_fallback(disp, aux_pool, funcionarios, folga_rest):
 
 # ---------- MOTOR PRINCIPAL (AJUSTADO PARA 4x1 / 4x2 / 4x3 + blocos fixos 4 dias) ----------
 #   + ELASTICIDADE DE BLOCO 5/6 DIAS (2025‑12‑18)
+#   + TENTATIVAS INDEPENDENTES / POOL DE PROCESSOS
 
-def motor_gerar_dias_mes(ano, mes, funcionarios, params, info,
-                         estado_acumulado=None, estado_continuo=None,
-                         FLEXIBILIZAR=True, tentativas=50, perfis=None,
-                         mes_acum_horas=None):
-    """
-    Motor gerador puro: devolve grade crua + métricas.
+MODELOS_SEMANA = {
+    "4x1": {"folga": 2, "demanda": {"00H": 1, "06H": 2, "12H": 2, "18H": 2}},
+    "4x2": {"folga": 2, "demanda": {"00H": 2, "06H": 2, "12H": 2, "18H": 2}},
+    "4x3": {"folga": 3, "demanda": {"00H": 2, "06H": 2, "12H": 2, "18H": 2}},
+}
 
-    PRINCÍPIO BASE (4x1 / 4x2 / 4x3):
-      - Todo bloco de TRABALHO é FIXO: 4 dias no mesmo turno.
-      - Ao terminar o bloco, entra em FOLGA (2 ou 3 dias) definida no INÍCIO do ciclo.
-      - Ao terminar folga, avança turno no CICLO: 00 -> 18 -> 12 -> 06 -> 00.
-      - O MODELO (4x1/4x2/4x3) é escolhido POR SEMANA, baseado em ATIVOS reais.
 
-    ELASTICIDADE 2025‑12‑18:
-      - Se houver escassez, o bloco pode ser estendido explicitamente para 5 ou 6 dias.
-      - A decisão é diária, conforme pressão calculada antes da alocação.
-      - Nenhum operador excede 6 dias consecutivos.
-    """
-    # -------------------------
-    # Helpers locais (auto-contido)
-    # -------------------------
-    MODELOS = {
-        "4x1": {"folga": 2, "demanda": {"00H": 1, "06H": 2, "12H": 2, "18H": 2}},
-        "4x2": {"folga": 2, "demanda": {"00H": 2, "06H": 2, "12H": 2, "18H": 2}},
-        "4x3": {"folga": 3, "demanda": {"00H": 2, "06H": 2, "12H": 2, "18H": 2}},
-    }
+def contar_ativos_semana(funcs, ferias_map, monday, sunday):
+    """Ativos = não ausente a semana inteira (férias cobrindo de segunda a domingo)."""
+    ativos = 0
+    for f in funcs:
+        fid = str(f["id"])
+        ausente_semana = False
+        for ini, fim in ferias_map.get(fid, []):
+            if ini <= monday and fim >= sunday:
+                ausente_semana = True
+                break
+        if not ausente_semana:
+            ativos += 1
+    return max(0, ativos)
 
-    def _em_ferias(fid, data_):
-        return any(ini <= data_ <= fim for ini, fim in info["ferias"].get(fid, []))
-
-    def contar_ativos_semana(funcs, ferias_map, monday, sunday):
-        """Ativos = não ausente a semana inteira (férias cobrindo de segunda a domingo)."""
-        ativos = 0
-        for f in funcs:
-            fid = str(f["id"])
-            ausente_semana = False
-            for ini, fim in ferias_map.get(fid, []):
-                if ini <= monday and fim >= sunday:
-                    ausente_semana = True
-                    break
-            if not ausente_semana:
-                ativos += 1
-        return max(0, ativos)
 
-    def escolher_modelo_semana(ativos):
-        """
-        Heurística simples (ajuste depois se quiser):
-          - >= 14 ativos => 4x3 (folga 3)
-          - >= 12 ativos => 4x2 (folga 2)
-          - <  12 ativos => 4x1 (reduz madrugada) (folga 2)
-        """
-        if ativos >= 14:
-            return "4x3"
-        if ativos >= 12:
-            return "4x2"
-        return "4x1"
-
-    def _pick_melhor(candidatos, d_local, h_local):
-        """Escolha leve: menos dias no mês, depois menos horas, depois ruído."""
-        if not candidatos:
-            return None
-        return min(
-            candidatos,
-            key=lambda f: (
-                d_local.get(str(f["id"]), 0),
-                h_local.get(str(f["id"]), 0),
-                random.random(),
-            ),
-        )
+def escolher_modelo_semana(ativos):
+    """
+    Heurística simples (ajuste depois se quiser):
+      - >= 14 ativos => 4x3 (folga 3)
+      - >= 12 ativos => 4x2 (folga 2)
+      - <  12 ativos => 4x1 (reduz madrugada) (folga 2)
+    """
+    if ativos >= 14:
+        return "4x3"
+    if ativos >= 12:
+        return "4x2"
+    return "4x1"
 
-    def _pick_por_perfil(cands, perfil, d_local, h_local):
-        prefer = [f for f in cands if f.get("perfil") == perfil]
-        return _pick_melhor(prefer or cands, d_local, h_local)
 
-    def _iniciar_bloco(fid, turno, work_left, off_len_atual, turno_atual, folga_prox, block_len):
-        """Início de ciclo travado: trabalho 4 dias fixos + folga (2/3) definida agora."""
-        turno_atual[fid] = turno
-        work_left[fid] = 4
-        off_len_atual[fid] = int(folga_prox)
-        block_len[fid] = 0      ##### ELASTIC #####  zeramos comprimento do novo bloco
+def _topo_vivo(heap, alocados):
+    """Descarta do topo quem já foi alocado hoje (remoção preguiçosa)."""
+    while heap and heap[0][3] in alocados:
+        heappop(heap)
+    return heap[0] if heap else None
 
-    # -------------------------
-    # Setup base
-    # -------------------------
-    funcionarios = [f for f in funcionarios if f.get("perfil") in ("EXP", "AUX")]
-    dias_no_mes = dias_do_mes(ano, mes)
 
-    if perfis is None:
-        perfis = {"EXP": [], "AUX": []}
-        for f in funcionarios:
-            perfis[f["perfil"]].append(f)
+def _pick_melhor(heap, alocados):
+    """Escolha leve: menos dias no mês, depois menos horas, depois ruído."""
+    if _topo_vivo(heap, alocados) is None:
+        return None
+    return heappop(heap)[3]
 
-    horas = dict(estado_acumulado["horas"]) if estado_acumulado else {str(f["id"]): 0 for f in funcionarios}
-    dias_trab = dict(estado_acumulado["dias_trab"]) if estado_acumulado else {str(f["id"]): 0 for f in funcionarios}
 
-    melhor_score, melhor_dias, melhor_outros = float("inf"), None, {}
+def _pick_por_perfil(balde, perfil, alocados):
+    """`balde` = (heap EXP, heap AUX); cai no outro perfil se o pedido acabou."""
+    prefer, outro = balde if perfil == "EXP" else balde[::-1]
+    escolhido = _pick_melhor(prefer, alocados)
+    return _pick_melhor(outro, alocados) if escolhido is None else escolhido
 
-    # cache semanal: week_id -> {"modelo","folga","demanda","ativos"}
-    week_cfg_cache = {}
 
-    for _ in range(tentativas):
-        # -------------------------
-        # Estados (por tentativa)
-        # -------------------------
-        h_local = dict(horas)
-        d_local = dict(dias_trab)
+def _balde_vazio(balde, alocados):
+    return _topo_vivo(balde[0], alocados) is None and _topo_vivo(balde[1], alocados) is None
 
-        stats = {str(f["id"]): {t: 0 for t in TURNOS} for f in funcionarios}
-        dias_trab_mes = {str(f["id"]): 0 for f in funcionarios}
-        dias_semana = {str(f["id"]): {} for f in funcionarios}
 
-        # Mantemos esses estados antigos só para compatibilidade interna (não é o motor principal)
-        c = {str(f["id"]): estado_continuo["consec"].get(str(f["id"]), 0) if estado_continuo else 0 for f in funcionarios}
-        u_turno = {str(f["id"]): estado_continuo["ultimo_turno"].get(str(f["id"])) if estado_continuo else None for f in funcionarios}
+def _iniciar_bloco(i, turno, work_left, off_len_atual, turno_atual, folga_prox, block_len):
+    """Início de ciclo travado: trabalho 4 dias fixos + folga (2/3) definida agora."""
+    turno_atual[i] = turno
+    work_left[i] = 4
+    off_len_atual[i] = int(folga_prox)
+    block_len[i] = 0      ##### ELASTIC #####  zeramos comprimento do novo bloco
 
-        # -------------------------
-        # NOVO: estado do ciclo (4 trabalho + 2/3 folga) + comprimento do bloco
-        # -------------------------
-        turno_atual = {str(f["id"]): None for f in funcionarios}   # turno do ciclo
-        work_left   = {str(f["id"]): 0    for f in funcionarios}   # dias restantes do bloco
-        off_left    = {str(f["id"]): 0    for f in funcionarios}   # dias restantes de folga
-        off_len_atual = {str(f["id"]): None for f in funcionarios} # folga configurada no início
-        block_len   = {str(f["id"]): 0    for f in funcionarios}   # ##### ELASTIC ##### tamanho atual do bloco
-
-        # Controle de entrada em férias para não “avançar turno” todo dia
-        em_ferias_ontem = {str(f["id"]): False for f in funcionarios}
-
-        # Continuidade do mês anterior
-        if estado_continuo:
-            for fid, cons in estado_continuo["consec"].items():
-                if cons and estado_continuo["ultimo_turno"].get(fid):
-                    turno_atual[fid] = estado_continuo["ultimo_turno"][fid]
-                    block_len[fid] = cons  ##### ELASTIC #####  leva adiante comprimento já trabalhado
-                    if cons < 4:
-                        work_left[fid] = 4 - cons
-                        off_left[fid] = 0
-                    else:
-                        work_left[fid] = 0
-                        off_left[fid] = 2
-                        off_len_atual[fid] = 2
-                else:
-                    block_len[fid] = 0
 
-        dias_mes = []
+def _semente_base(params):
+    """`parametros.seed` fixa a sequência; sem ela sorteamos uma por chamada."""
+    seed = (params or {}).get("seed")
+    return random.getrandbits(64) if seed is None else seed
 
-        # -------------------------
-        # Loop diário
-        # -------------------------
-        for dia in range(1, dias_no_mes + 1):
-            data_atual = datetime(ano, mes, dia).date()
-            week_year, week_num, _ = data_atual.isocalendar()
-            week_id = f"{week_year}-{week_num:02d}"
-
-            # Escolhe modelo por semana
-            if week_id not in week_cfg_cache:
-                monday = datetime.fromisocalendar(week_year, week_num, 1).date()
-                sunday = monday + timedelta(days=6)
-                ativos = contar_ativos_semana(funcionarios, info["ferias"], monday, sunday)
-                modelo = escolher_modelo_semana(ativos)
-                cfg = MODELOS[modelo]
-                week_cfg_cache[week_id] = {
-                    "modelo": modelo,
-                    "folga": cfg["folga"],
-                    "demanda": cfg["demanda"],
-                    "ativos": ativos,
-                }
-
-            cfg_semana = week_cfg_cache[week_id]
-            demanda = cfg_semana["demanda"]
-            folga_prox = cfg_semana["folga"]
-
-            # ---------- ELASTIC ----------
-            # Calcula pressão de demanda ANTES das alocações
-            em_ferias_hoje = {str(f["id"]): _em_ferias(str(f["id"]), data_atual) for f in funcionarios}
-            operadores_disponiveis = sum(1 for fid in em_ferias_hoje if not em_ferias_hoje[fid])
-            demanda_total_dia = sum(demanda.values())
-            pressao = demanda_total_dia / operadores_disponiveis if operadores_disponiveis else 1
-            if pressao <= 0.65:
-                max_bloco_dia = 4
-            elif pressao <= 0.75:
-                max_bloco_dia = 5
-            else:
-                max_bloco_dia = 6
-            ##### ELASTIC #####  max_bloco_dia definido conforme pressão ({pressao:.2f})
 
-            linha = {"data": str_data(ano, mes, dia), "turnos": {}}
-            alocados_hoje = set()
+def _rng_tentativa(semente, ano, mes, idx):
+    """
+    Fluxo aleatório próprio de cada tentativa, derivado só de (seed, mês, índice).
+    Semear com str usa SHA-512 internamente: estável entre processos e execuções,
+    então o resultado não depende de quantos workers rodaram as tentativas.
+    """
+    return random.Random(f"{semente}-{ano}-{int(mes):02d}-{idx}")
 
-            # Disponíveis hoje: não está de folga e não está de férias hoje
-            disp = [
-                f for f in funcionarios
-                if off_left[str(f["id"])] == 0
-                and not em_ferias_hoje[str(f["id"])]
-            ]
-            random.shuffle(disp)
-
-            # -------------------------
-            # Preenche turno a turno
-            # -------------------------
-            for turno in TURNOS:
-                vagas = int(demanda.get(turno, 2))
-                aloc = []
-
-                def candidatos_base():
-                    return [f for f in disp if str(f["id"]) not in alocados_hoje]
-
-                def cand_em_ciclo(turno_):
-                    return [
-                        f for f in candidatos_base()
-                        if turno_atual.get(str(f["id"])) == turno_ and work_left.get(str(f["id"]), 0) > 0
-                    ]
-
-                def cand_para_iniciar(turno_):
-                    return [
-                        f for f in candidatos_base()
-                        if turno_atual.get(str(f["id"])) == turno_ and work_left.get(str(f["id"]), 0) == 0 and off_left.get(str(f["id"]), 0) == 0
-                    ]
-
-                def cand_sem_turno():
-                    return [
-                        f for f in candidatos_base()
-                        if turno_atual.get(str(f["id"])) is None and work_left.get(str(f["id"]), 0) == 0 and off_left.get(str(f["id"]), 0) == 0
-                    ]
-
-                while len(aloc) < vagas:
-                    base = cand_em_ciclo(turno) or cand_para_iniciar(turno) or cand_sem_turno()
-
-                    if not base and FLEXIBILIZAR:
-                        base = candidatos_base()
-                    if not base:
-                        break
-
-                    if vagas == 2:
-                        if len(aloc) == 0:
-                            escolhido = _pick_por_perfil(base, "EXP", d_local, h_local) or _pick_melhor(base, d_local, h_local)
-                        else:
-                            primeiro = aloc[0].get("perfil")
-                            alvo = "AUX" if primeiro == "EXP" else "EXP"
-                            escolhido = _pick_por_perfil(base, alvo, d_local, h_local) or _pick_melhor(base, d_local, h_local)
-                    else:
-                        escolhido = _pick_por_perfil(base, "EXP", d_local, h_local) or _pick_melhor(base, d_local, h_local)
-
-                    if not escolhido:
-                        break
-
-                    fid = str(escolhido["id"])
-                    if turno_atual[fid] is None:
-                        turno_atual[fid] = turno
-
-                    if work_left[fid] == 0 and off_left[fid] == 0:
-                        _iniciar_bloco(fid, turno_atual[fid], work_left, off_len_atual, turno_atual, folga_prox, block_len)
-
-                    aloc.append(escolhido)
-                    alocados_hoje.add(fid)
-
-                linha["turnos"][turno] = aloc
-
-                # stats + ultimo turno do dia + comprimento de bloco
-                for op in aloc:
-                    fid = str(op["id"])
-                    stats[fid][turno] += 1
-                    u_turno[fid] = turno
-                    block_len[fid] += 1   ##### ELASTIC #####  conta dia no bloco atual
-
-            # -------------------------
-            # Consolida quem trabalhou hoje
-            # -------------------------
-            ids_trab = {str(e["id"]) for t in TURNOS for e in linha["turnos"].get(t, [])}
-
-            for fid in ids_trab:
-                h_local[fid] += HORAS_POR_TURNO
-                d_local[fid] += 1
-                dias_trab_mes[fid] += 1
-                dias_semana[fid][week_id] = dias_semana[fid].get(week_id, 0) + 1
-
-            # -------------------------
-            # UPDATE DO CICLO + ELASTICIDADE
-            # -------------------------
-            for fid in ids_trab:
-                if work_left[fid] <= 0:
-                    _iniciar_bloco(fid, turno_atual.get(fid) or u_turno.get(fid) or "00H",
-                                   work_left, off_len_atual, turno_atual, folga_prox, block_len)
-
-                work_left[fid] = max(0, work_left[fid] - 1)
-
-                # Quando bloco chega a 0, avalia extensão
-                if work_left[fid] == 0:
-                    if block_len[fid] >= 4 and block_len[fid] < max_bloco_dia:
-                        # ##### ELASTIC #####  estendendo bloco por escassez
-                        work_left[fid] = 1   # adiciona mais 1 dia de trabalho
-                        # Comentário: bloco estendido (len={} → limite {})
-                    else:
-                        off_left[fid] = int(off_len_atual[fid] or folga_prox)
-                        block_len[fid] = 0  # reset comprimento após folga
-                c[fid] = c.get(fid, 0) + 1
-
-            # 2) Quem não trabalhou hoje:
-            for f in funcionarios:
-                fid = str(f["id"])
-                if fid in ids_trab:
-                    continue
 
-                if em_ferias_hoje[fid] and not em_ferias_ontem.get(fid, False):
-                    if turno_atual.get(fid):
-                        turno_atual[fid] = CICLO_TURNOS[turno_atual[fid]]
-                    work_left[fid] = off_left[fid] = 0
-                    off_len_atual[fid] = None
-                    block_len[fid] = 0
-                    c[fid] = 0
-                    continue
+def _preparar_contexto_motor(ano, mes, funcionarios, info, estado_acumulado,
+                             estado_continuo, FLEXIBILIZAR, estado_ciclo=None):
+    """
+    Tudo que é invariante entre tentativas; também é o que vai para os workers.
+    Operadores viram índices densos 0..n-1 (ordem de `funcionarios`); ids e
+    nomes só voltam na tradução da tentativa vencedora.
 
-                if em_ferias_hoje[fid]:
-                    c[fid] = 0
-                    continue
+    O ciclo inicial vem de `estado_ciclo` (snapshot exato do mês anterior)
+    ou, na falta dele, é reconstruído de `estado_continuo`.
+    """
+    dias_no_mes = dias_do_mes(ano, mes)
+    fids = [str(f["id"]) for f in funcionarios]
 
-                if off_left[fid] > 0:
-                    off_left[fid] = max(0, off_left[fid] - 1)
-                    c[fid] = 0
-                    if off_left[fid] == 0 and turno_atual.get(fid):
-                        turno_atual[fid] = CICLO_TURNOS[turno_atual[fid]]
-                        off_len_atual[fid] = None
-                        block_len[fid] = 0
-                    continue
+    # cache semanal: week_id -> {"modelo","folga","demanda","ativos"}
+    week_cfg = {}
+    for dia in range(1, dias_no_mes + 1):
+        week_year, week_num, _ = datetime(ano, mes, dia).date().isocalendar()
+        week_id = f"{week_year}-{week_num:02d}"
+        if week_id in week_cfg:
+            continue
+        monday = datetime.fromisocalendar(week_year, week_num, 1).date()
+        sunday = monday + timedelta(days=6)
+        ativos = contar_ativos_semana(funcionarios, info["ferias"], monday, sunday)
+        modelo = escolher_modelo_semana(ativos)
+        cfg = MODELOS_SEMANA[modelo]
+        week_cfg[week_id] = {
+            "modelo": modelo,
+            "folga": cfg["folga"],
+            "demanda": cfg["demanda"],
+            "ativos": ativos,
+        }
 
-                if work_left[fid] > 0:
-                    work_left[fid] = 0
-                    off_left[fid] = int(off_len_atual[fid] or 2)
-                    off_len_atual[fid] = off_left[fid]
-                    block_len[fid] = 0
-                    c[fid] = 0
-                    continue
+    livre, ferias = disponibilidade_mes(funcionarios, info, ano, mes)
 
-                block_len[fid] = 0
-                c[fid] = 0
+    teto_trab = [_teto_dias_trabalho(linha) for linha in livre]
+    tabela_dias = _tabela_dias(ano, mes, week_cfg, livre, ferias)
 
-            em_ferias_ontem = em_ferias_hoje
-            dias_mes.append(linha)
+    # demanda_depois[dia] = vagas somadas dos dias após `dia` (teto de horas do mês)
+    demanda_depois = [0] * (dias_no_mes + 1)
+    for dia in range(dias_no_mes - 1, -1, -1):
+        demanda_depois[dia] = demanda_depois[dia + 1] + sum(tabela_dias[dia]["vagas"])
 
-        # -------------------------
-        # Score simples (equilíbrio de horas)
-        # -------------------------
-        valores = list(h_local.values())
-        if not valores:
-            continue
-        score = (max(valores) - min(valores)) + statistics.mean(valores) / 5
-        if score < melhor_score:
-            melhor_score = score
-            melhor_dias = dias_mes
-            melhor_outros = {"horas": h_local, "stats": stats, "dias_trab": d_local}
+    horas = dict(estado_acumulado["horas"]) if estado_acumulado else {fid: 0 for fid in fids}
+    dias_trab = dict(estado_acumulado["dias_trab"]) if estado_acumulado else {fid: 0 for fid in fids}
 
-    return {
-        "dias": melhor_dias,
-        **melhor_outros,
-        "score": melhor_score,
+    # Continuidade do mês anterior → estado inicial do ciclo por índice
+    ciclo0 = {
+        "turno_atual":   array("b", [SEM_TURNO] * len(fids)),
+        "work_left":     array("b", [0] * len(fids)),
+        "off_left":      array("b", [0] * len(fids)),
+        "off_len_atual": array("b", [0] * len(fids)),   # 0 = ainda não definida
+        "block_len":     array("b", [0] * len(fids)),
     }
+    ferias_ontem0 = [False] * len(fids)
+    if estado_ciclo:
+        # snapshot exato do fim do mês anterior (ver _snapshot_ciclo)
+        ciclo0, ferias_ontem0 = _ciclo_do_snapshot(estado_ciclo, fids, ciclo0, ferias_ontem0)
+        # parado (sem bloco nem folga) já está no próximo turno do CICLO; só
+        # recomeça sem turno se esse turno não estiver livre no início do mês
+        for i, t in enumerate(ciclo0["turno_atual"]):
+            if t != SEM_TURNO and not ciclo0["work_left"][i] and not ciclo0["off_left"][i] \
+                    and _turno_indisponivel_no_inicio(livre[i], t):
+                ciclo0["turno_atual"][i] = SEM_TURNO
+    elif estado_continuo:
+        pos = {fid: i for i, fid in enumerate(fids)}
+        for fid, cons in estado_continuo["consec"].items():
+            i, ut = pos.get(fid), estado_continuo["ultimo_turno"].get(fid)
+            if i is None or not cons or not ut:
+                continue
+            ciclo0["turno_atual"][i] = IDX_TURNO[ut]
+            ciclo0["block_len"][i] = min(cons, 127)  ##### ELASTIC #####  leva adiante comprimento já trabalhado
+            if cons < 4:
+                ciclo0["work_left"][i] = 4 - cons
+            else:
+                ciclo0["off_left"][i] = 2
+                ciclo0["off_len_atual"][i] = 2
 
-# ========================
-# RELATÓRIO / PARECER (MANTER COMO HOJE)
-# ========================
-def gerar_parecer_escala(dias, funcionarios):
-    p = {
-        str(f["id"]): {
-            "funcionario_id": f["id"],
-            "nome":           f.get("nome"),
-            "dias_trabalhados": 0,
-            "dias_folga":       0,
-            "total_horas":      0,
-            "vezes_00h":        0,
-            "vezes_06h":        0,
-            "vezes_12h":        0,
-            "vezes_18h":        0,
-            "maior_seq_dias_trab":          0,
-            "menor_seq_dias_mesmo_turno":  None,
-            "trocas_de_turno":              0,
-        }
-        for f in funcionarios
+    return {
+        "ano": ano,
+        "mes": mes,
+        "dias_no_mes": dias_no_mes,
+        "funcionarios": funcionarios,
+        "fids": fids,
+        "eh_exp": [f.get("perfil") == "EXP" for f in funcionarios],
+        "horas": horas,
+        "dias_trab": dias_trab,
+        "h0": array("i", [int(horas.get(fid, 0)) for fid in fids]),
+        "d0": array("i", [int(dias_trab.get(fid, 0)) for fid in fids]),
+        "ciclo0": ciclo0,
+        "ferias_ontem0": ferias_ontem0,
+        "FLEXIBILIZAR": FLEXIBILIZAR,
+        "week_cfg": week_cfg,
+        "livre": livre,     # [i][dia-1][t], i na ordem de `funcionarios`
+        "ferias": ferias,   # [i][dia-1]
+        "tabela_dias": tabela_dias,
+        "teto_trab": teto_trab,
+        "demanda_depois": demanda_depois,
+        "poda": True,
     }
-    ult         = {str(f["id"]): None for f in funcionarios}
-    seq_trab    = {str(f["id"]): 0    for f in funcionarios}
-    seq_t_mesmo = {str(f["id"]): 0    for f in funcionarios}
-
-    for dia in dias:
-        trabalhou = {str(f["id"]): False for f in funcionarios}
-        for turno, dupla in dia["turnos"].items():
-            for nome in dupla:
-                fid = next((str(f["id"]) for f in funcionarios if f["nome"] == nome), None)
-                if not fid:
-                    continue
-                pr = p[fid]
-                if not trabalhou[fid]:
-                    pr["dias_trabalhados"] += 1
-                trabalhou[fid]   = True
-                pr["total_horas"] += HORAS_POR_TURNO
-                pr[f"vezes_{turno.lower()}"] += 1
-
-                if ult[fid] == turno:
-                    seq_t_mesmo[fid] += 1
-                else:
-                    if seq_t_mesmo[fid]:
-                        pr["menor_seq_dias_mesmo_turno"] = (
-                            seq_t_mesmo[fid] if pr["menor_seq_dias_mesmo_turno"] is None
-                            else min(pr["menor_seq_dias_mesmo_turno"], seq_t_mesmo[fid])
-                        )
-                    seq_t_mesmo[fid] = 1
-                    if ult[fid] is not None:
-                        pr["trocas_de_turno"] += 1
-                ult[fid] = turno
-
-        for f in funcionarios:
-            fid = str(f["id"])
-            if trabalhou[fid]:
-                seq_trab[fid] += 1
-                p[fid]["maior_seq_dias_trab"] = max(p[fid]["maior_seq_dias_trab"], seq_trab[fid])
-            else:
-                if seq_t_mesmo[fid]:
-                    p[fid]["menor_seq_dias_mesmo_turno"] = (
-                        seq_t_mesmo[fid] if p[fid]["menor_seq_dias_mesmo_turno"] is None
-                        else min(p[fid]["menor_seq_dias_mesmo_turno"], seq_t_mesmo[fid])
-                    )
-                seq_trab[fid] = seq_t_mesmo[fid] = 0
 
-    for fid, pr in p.items():
-        pr["dias_folga"] = len(dias) - pr["dias_trabalhados"]
-        if pr["menor_seq_dias_mesmo_turno"] is None:
-            pr["menor_seq_dias_mesmo_turno"] = 1
-    return list(p.values())
 
+# Invariantes do ciclo usados pela poda: sequência de trabalho <= 6 dias
+# (bloco de 4 + elasticidade) e, ao encerrá-la, ao menos 2 dias de folga.
+_SEQ_MAX_POD = 6
+_FOLGA_MAX_POD = 3
 
-# ========================
-# GERADORES (MÊS/ANO) – CASCA
-# ========================
-def gerar_escala_mes(ano, mes, funcionarios, params, info,
-                     estado_acumulado=None, FLEXIBILIZAR=True,
-                     tentativas=50, perfis=None, mes_acum_horas=None,
-                     estado_continuo=None):
-    """Casca fina: prepara, chama motor, formata saída e parecer."""
-    funcionarios = [f for f in funcionarios if f.get("perfil") in ("EXP", "AUX")]
+# A poda só é testada nos últimos PODA_DIAS_FINAIS dias do mês. O score é
+# max - min + média/5 das horas e, enquanto sobra mês, as vagas restantes
+# ainda podem nivelar as horas: nenhum limite admissível corta antes (em
+# 16 operadores as podas caem entre os dias 24 e 31 de 31).
+PODA_DIAS_FINAIS = 8
 
-    res_motor = motor_gerar_dias_mes(
-        ano, mes, funcionarios, params, info,
-        estado_acumulado=estado_acumulado,
-        estado_continuo=estado_continuo,
-        FLEXIBILIZAR=FLEXIBILIZAR,
-        tentativas=tentativas,
-        perfis=perfis,
-        mes_acum_horas=mes_acum_horas,
+
+def _teto_dias_trabalho(livre_op):
+    """
+    Programação dinâmica, de trás para frente, sobre os dias do mês de um
+    operador: teto[(dia * 7 + seq) * 4 + folga] = máximo de dias que ele ainda
+    pode trabalhar depois de `dia`, terminando o dia com `seq` dias seguidos
+    trabalhados e `folga` dias de folga pendentes. É um relaxamento das
+    regras do motor (nunca menor que o real), então serve de limite superior.
+    """
+    n_dias = len(livre_op)
+    S, F = _SEQ_MAX_POD + 1, _FOLGA_MAX_POD + 1
+    teto = [0] * ((n_dias + 1) * S * F)
+    for dia in range(n_dias - 1, -1, -1):
+        pode = any(livre_op[dia])   # dia seguinte (dia + 1), índice 0-based
+        prox = (dia + 1) * S * F
+        base = dia * S * F
+        for s in range(S):
+            for k in range(F):
+                if k > 0:
+                    v = teto[prox + k - 1]                           # folga segue
+                elif not pode:
+                    v = teto[prox]                                   # férias/restrição
+                else:
+                    v = teto[prox + (1 if s else 0)]                 # não trabalha
+                    if s < _SEQ_MAX_POD:
+                        v = max(v, 1 + teto[prox + (s + 1) * F])     # trabalha
+                teto[base + s * F + k] = v
+    return teto
+
+
+def _limite_inferior_score(h_local, teto_trab, block_len, off_left, demanda_rest, dia):
+    """
+    Menor score final possível a partir do fim de `dia`. Com M = média final:
+      max final >= max(h)                       (horas só crescem)
+      min final <= min(h_i + 6 * teto_i)        (teto_trab, dado o ciclo de i)
+      min final <= M <= média(h) + 6 * demanda_rest / n
+    score = max - min + M/5 é minimizado no menor M que ainda libera o min,
+    o que dá o limite abaixo (nunca maior que o score real).
+    """
+    n = len(h_local)
+    maximo, media = max(h_local), sum(h_local) / n
+    media_teto = media + HORAS_POR_TURNO * demanda_rest / n
+    S, F = _SEQ_MAX_POD + 1, _FOLGA_MAX_POD + 1
+    base = dia * S * F
+    teto_min = min(
+        h_local[i] + HORAS_POR_TURNO * teto_trab[i][base + min(block_len[i], _SEQ_MAX_POD) * F
+                                                      + min(off_left[i], _FOLGA_MAX_POD)]
+        for i in range(n)
     )
+    m = max(media, min(teto_min, media_teto))
+    return max(maximo - min(teto_min, m) + m / 5, media / 5)
 
-    dias_out = [
-        {
-            "data":  d["data"],
-            "turnos": {t: [f["nome"] for f in dupla] for t, dupla in d["turnos"].items()},
-        }
-        for d in res_motor["dias"]
-    ]
 
-    parecer = gerar_parecer_escala(dias_out, funcionarios)
-    print(f"\033[92mMelhor score {ano}-{parse_mes(mes)}: {res_motor['score']:.2f}\033[0m")
+def _tabela_dias(ano, mes, week_cfg, livre, ferias):
+    """
+    Tudo do dia que não depende da tentativa, calculado uma vez por mês:
+    semana e seu modelo, vagas por turno, quem está de férias/livre hoje,
+    pressão de demanda e o bloco máximo elástico que ela permite.
+    Compartilhada, somente leitura, por todas as tentativas e workers.
+    """
+    n = len(livre)
+    tabela = []
+    for dia in range(1, dias_do_mes(ano, mes) + 1):
+        week_year, week_num, _ = datetime(ano, mes, dia).date().isocalendar()
+        week_id = f"{week_year}-{week_num:02d}"
+        cfg_semana = week_cfg[week_id]
+        demanda = cfg_semana["demanda"]
+        vagas = [int(demanda.get(turno, 2)) for turno in TURNOS]
+
+        # ---------- ELASTIC ----------
+        # pressão de demanda ANTES das alocações
+        em_ferias_hoje = [ferias[i][dia - 1] for i in range(n)]
+        operadores_disponiveis = n - sum(em_ferias_hoje)
+        pressao = sum(demanda.values()) / operadores_disponiveis if operadores_disponiveis else 1
+        if pressao <= 0.65:
+            max_bloco_dia = 4
+        elif pressao <= 0.75:
+            max_bloco_dia = 5
+        else:
+            max_bloco_dia = 6
+
+        tabela.append({
+            "week_id": week_id,
+            "folga": cfg_semana["folga"],
+            "vagas": vagas,
+            "em_ferias": em_ferias_hoje,
+            "livre": [livre[i][dia - 1] for i in range(n)],
+            "operadores_disponiveis": operadores_disponiveis,
+            "pressao": pressao,
+            "max_bloco_dia": max_bloco_dia,
+        })
+    return tabela
+
+
+def _heaps_perfil(itens, eh_exp):
+    """Par de heaps (EXP, AUX) a partir de itens (d_local, h_local, ruído, i)."""
+    balde = ([], [])
+    for item in itens:
+        balde[0 if eh_exp[item[3]] else 1].append(item)
+    heapify(balde[0])
+    heapify(balde[1])
+    return balde
+
+
+def _baldes_candidatos(disp, livre_hoje, turno_atual, work_left, eh_exp, d_local, h_local, rng):
+    """
+    Candidatos do dia separados uma vez por estado de ciclo, por turno:
+    baldes[t] = (em ciclo em t, pronto para iniciar em t, sem turno), cada
+    um um par de heaps (EXP, AUX) com chave (d_local, h_local, ruído).
+    Durante o dia nem o ciclo nem a chave de quem não foi alocado mudam,
+    então os heaps valem o dia todo; o alocado não é retirado, só ignorado
+    quando chega ao topo (_topo_vivo). Devolve também os itens por operador,
+    para montar sob demanda o balde de FLEXIBILIZAR.
+    """
+    itens = {i: (d_local[i], h_local[i], rng.random(), i) for i in disp}
+    baldes = [([], [], []) for _ in TURNOS]
+    for i in disp:
+        ta, wl = turno_atual[i], work_left[i]
+        if ta == SEM_TURNO:
+            if wl:
+                continue
+            for t, por_turno in enumerate(baldes):
+                if livre_hoje[i][t]:
+                    por_turno[2].append(itens[i])
+        elif livre_hoje[i][ta]:
+            baldes[ta][0 if wl > 0 else 1].append(itens[i])
+    baldes = [tuple(_heaps_perfil(b, eh_exp) for b in por_turno) for por_turno in baldes]
+    return baldes, itens
+
+
+def _fechar_dia_ciclo(n, alocados_hoje, hoje, em_ferias_ontem, u_turno,
+                      turno_atual, work_left, off_left, off_len_atual, block_len):
+    """
+    Fim do dia no ciclo 4 + folga: avança bloco/folga de cada operador
+    (in place) conforme trabalhou ou não hoje. Devolve quantos blocos foram
+    estendidos pela elasticidade.
+    """
+    folga_prox = hoje["folga"]
+    em_ferias_hoje = hoje["em_ferias"]
+    max_bloco_dia = hoje["max_bloco_dia"]
+    n_ext = 0
+    for i in alocados_hoje:
+        if work_left[i] <= 0:
+            off_left[i] = 0
+            t_ini = turno_atual[i] if turno_atual[i] != SEM_TURNO else u_turno[i]
+            _iniciar_bloco(i, t_ini if t_ini != SEM_TURNO else 0,
+                           work_left, off_len_atual, turno_atual, folga_prox, block_len)
+
+        work_left[i] = max(0, work_left[i] - 1)
+
+        # Quando bloco chega a 0, avalia extensão
+        if work_left[i] == 0:
+            if block_len[i] >= 4 and block_len[i] < max_bloco_dia:
+                # ##### ELASTIC #####  estendendo bloco por escassez
+                work_left[i] = 1   # adiciona mais 1 dia de trabalho
+                n_ext += 1
+            else:
+                off_left[i] = off_len_atual[i] or folga_prox
+                block_len[i] = 0  # reset comprimento após folga
 
-    return {
-        "dias":    dias_out,
-        "horas":   res_motor["horas"],
-        "stats":   res_motor["stats"],
-        "dias_trab": res_motor["dias_trab"],
-        "score":   res_motor["score"],
-        "parecer": parecer,
-    }
+    # 2) Quem não trabalhou hoje:
+    for i in range(n):
+        if i in alocados_hoje:
+            continue
 
+        if em_ferias_hoje[i] and not em_ferias_ontem[i]:
+            if turno_atual[i] != SEM_TURNO:
+                turno_atual[i] = PROX_TURNO[turno_atual[i]]
+            work_left[i] = off_left[i] = 0
+            off_len_atual[i] = 0
+            block_len[i] = 0
+            continue
 
-def gerar_escala_ano(ano, mes_inicio, funcionarios, params, info,
-                     FLEXIBILIZAR=True, tentativas=50):
-    resultados = {}
-    estado = None
-    for m in range(int(mes_inicio), 13):
-        print(f"\033[94mGerando escala para {ano}-{parse_mes(m)}\033[0m")
-        res = gerar_escala_mes(
-            ano, m, funcionarios, params, info,
-            estado_acumulado=estado, FLEXIBILIZAR=FLEXIBILIZAR,
-            tentativas=tentativas, mes_acum_horas=estado["horas"] if estado else None,
-        )
-        chave = f"{ano}-{parse_mes(m)}"
-        resultados[chave] = res
-        estado = {"horas": res["horas"], "dias_trab": res["dias_trab"]}
-    return {"ano": ano, "mes_inicio": parse_mes(mes_inicio), "escala": resultados}
+        if em_ferias_hoje[i]:
+            continue
 
+        if off_left[i] > 0:
+            off_left[i] -= 1
+            if off_left[i] == 0 and turno_atual[i] != SEM_TURNO:
+                turno_atual[i] = PROX_TURNO[turno_atual[i]]
+                off_len_atual[i] = 0
+                block_len[i] = 0
+            continue
 
-# ========================
-# HANDLER WEB / HTTP HELPERS
-# ========================
-def _cors_headers():
-    return {
-        "Access-Control-Allow-Origin":  "*",
-        "Access-Control-Allow-Methods": "POST,OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type",
-    }
+        if work_left[i] > 0:
+            work_left[i] = 0
+            off_left[i] = off_len_atual[i] or 2
+            off_len_atual[i] = off_left[i]
+            block_len[i] = 0
+            continue
 
+        block_len[i] = 0
 
-def _json(obj, status=200):
-    return (
-        json.dumps(obj, ensure_ascii=False, indent=2),
-        status,
-        {"Content-Type": "application/json", **_cors_headers()},
-    )
+    return n_ext
 
 
-def preparar_estado_continuo(escala_mes_anterior, funcionarios):
-    """Gera estado inicial quando há escala do mês anterior."""
-    if not escala_mes_anterior or "dias" not in escala_mes_anterior:
+def _simular_tentativa(ctx, rng, limite=float("inf"), eventos=None):
+    """
+    Uma tentativa completa do mês. Todo sorteio passa por `rng`, nunca pelo
+    `random` global, para que a tentativa seja reproduzível isoladamente.
+
+    Estado inteiro por índice de operador (arrays compactos). Devolve
+    (score, grade, h_local, d_local, stats) ou None se não há operadores;
+    `grade[dia-1][t]` é a lista de índices alocados no turno t.
+
+    PODA: ao fim de cada um dos últimos PODA_DIAS_FINAIS dias, se o limite
+    inferior do score já é >= `limite`
+    (score da melhor tentativa até aqui) a tentativa não pode vencer e é
+    abandonada; devolve então só o dia (int) em que foi podada.
+
+    `eventos` (dict de _contadores), se dado, recebe quantas vagas saíram do
+    fallback FLEXIBILIZAR e quantos blocos foram estendidos pela elasticidade.
+    """
+    n = len(ctx["fids"])
+    eh_exp = ctx["eh_exp"]
+    FLEXIBILIZAR = ctx["FLEXIBILIZAR"]
+    teto_trab, demanda_depois = ctx["teto_trab"], ctx["demanda_depois"]
+    podar = ctx["poda"] and limite < float("inf")
+    primeiro_dia_poda = ctx["dias_no_mes"] - PODA_DIAS_FINAIS + 1
+    if not n:
         return None
 
-    fids_validos = {str(f["id"]) for f in funcionarios}
+    # -------------------------
+    # Estados (por tentativa)
+    # -------------------------
+    h_local = array("i", ctx["h0"])
+    d_local = array("i", ctx["d0"])
+    stats = array("H", [0] * (n * len(TURNOS)))   # stats[i * 4 + t]
+    u_turno = array("b", [SEM_TURNO] * n)
 
-    consec           = {fid: 0 for fid in fids_validos}
-    ultimo_turno     = {fid: None for fid in fids_validos}
-    dias_trabalhados = {fid: 0 for fid in fids_validos}
-    pipocacoes       = {fid: 0 for fid in fids_validos}
+    # -------------------------
+    # Estado do ciclo (4 trabalho + 2/3 folga) + comprimento do bloco
+    # -------------------------
+    ciclo0 = ctx["ciclo0"]
+    turno_atual   = array("b", ciclo0["turno_atual"])    # turno do ciclo
+    work_left     = array("b", ciclo0["work_left"])      # dias restantes do bloco
+    off_left      = array("b", ciclo0["off_left"])       # dias restantes de folga
+    off_len_atual = array("b", ciclo0["off_len_atual"])  # folga configurada no início
+    block_len     = array("b", ciclo0["block_len"])      # ##### ELASTIC ##### tamanho atual do bloco
 
-    dias = sorted(escala_mes_anterior["dias"], key=lambda d: d["data"])
-    trabalhou_ontem = {fid: False for fid in fids_validos}
-    nome_para_id = {f["nome"]: str(f["id"]) for f in funcionarios}
+    # Controle de entrada em férias para não “avançar turno” todo dia
+    em_ferias_ontem = ctx["ferias_ontem0"]
 
-    for dia in dias:
-        trabalhou_hoje = {fid: False for fid in fids_validos}
-        for turno, pessoas in dia["turnos"].items():
-            for p in pessoas:
-                if isinstance(p, dict) and "funcionario_id" in p:
-                    fid = str(p["funcionario_id"])
-                elif isinstance(p, str):
-                    fid = nome_para_id.get(p)
-                else:
-                    fid = None
-                if fid not in fids_validos:
-                    continue
+    grade = []
+    n_flex = n_ext = 0
 
-                trabalhou_hoje[fid] = True
-                dias_trabalhados[fid] += 1
+    # -------------------------
+    # Loop diário
+    # -------------------------
+    for dia, hoje in enumerate(ctx["tabela_dias"], start=1):
+        folga_prox = hoje["folga"]
+        em_ferias_hoje = hoje["em_ferias"]
+        livre_hoje = hoje["livre"]
 
-                if trabalhou_ontem[fid]:
-                    consec[fid] += 1
+        linha = []
+        alocados_hoje = set()
+
+        # Disponíveis hoje: não está de folga e não está de férias hoje
+        disp = [i for i in range(n) if off_left[i] == 0 and not em_ferias_hoje[i]]
+        rng.shuffle(disp)
+        baldes, itens = _baldes_candidatos(disp, livre_hoje, turno_atual, work_left,
+                                           eh_exp, d_local, h_local, rng)
+
+        # -------------------------
+        # Preenche turno a turno
+        # -------------------------
+        for t_idx, vagas in enumerate(hoje["vagas"]):
+            aloc = []
+            em_ciclo, iniciar, sem_turno = baldes[t_idx]
+            todos = None
+
+            while len(aloc) < vagas:
+                base = next((b for b in (em_ciclo, iniciar, sem_turno)
+                             if not _balde_vazio(b, alocados_hoje)), None)
+
+                if base is None and FLEXIBILIZAR:
+                    if todos is None:
+                        todos = _heaps_perfil((itens[i] for i in disp if livre_hoje[i][t_idx]), eh_exp)
+                    base = todos
+                if base is None:
+                    break
+
+                if vagas == 2 and aloc:
+                    alvo = "AUX" if eh_exp[aloc[0]] else "EXP"
                 else:
-                    consec[fid] = 1
+                    alvo = "EXP"
+                escolhido = _pick_por_perfil(base, alvo, alocados_hoje)
 
-                if ultimo_turno[fid] and ultimo_turno[fid] != turno:
-                    if consec[fid] <= 2:
-                        pipocacoes[fid] += 1
+                if escolhido is None:
+                    break
+                if base is todos:
+                    n_flex += 1
 
-                ultimo_turno[fid] = turno
+                i = escolhido
+                if turno_atual[i] == SEM_TURNO:
+                    turno_atual[i] = t_idx
 
-        for fid in fids_validos:
-            if not trabalhou_hoje[fid]:
-                if consec[fid] > 0 and consec[fid] <= 2:
-                    pipocacoes[fid] += 1
-                consec[fid] = 0
+                if work_left[i] == 0 and off_left[i] == 0:
+                    _iniciar_bloco(i, turno_atual[i], work_left, off_len_atual, turno_atual, folga_prox, block_len)
 
-        trabalhou_ontem = trabalhou_hoje
+                aloc.append(i)
+                alocados_hoje.add(i)
 
-    penalidade_start = {}
-    max_trab = max(dias_trabalhados.values()) or 1
-    max_pipo = max(pipocacoes.values()) or 1
-    for fid in fids_validos:
-        peso_trabalho = dias_trabalhados[fid] / max_trab
-        peso_pipoca   = pipocacoes[fid] / max_pipo
-        penalidade_start[fid] = peso_trabalho * 0.6 + peso_pipoca * 1.2
+            linha.append(aloc)
+
+            # stats + ultimo turno do dia + comprimento de bloco
+            for i in aloc:
+                stats[i * 4 + t_idx] += 1
+                u_turno[i] = t_idx
+                block_len[i] += 1   ##### ELASTIC #####  conta dia no bloco atual
+
+        # -------------------------
+        # Consolida quem trabalhou hoje
+        # -------------------------
+        for i in alocados_hoje:
+            h_local[i] += HORAS_POR_TURNO
+            d_local[i] += 1
+
+        # -------------------------
+        # UPDATE DO CICLO + ELASTICIDADE
+        # -------------------------
+        n_ext += _fechar_dia_ciclo(n, alocados_hoje, hoje, em_ferias_ontem, u_turno,
+                                   turno_atual, work_left, off_left, off_len_atual, block_len)
+        em_ferias_ontem = em_ferias_hoje
+        grade.append(linha)
+
+        # corte barato antes: o limite nunca passa do score parcial atual
+        if podar and dia >= primeiro_dia_poda and (max(h_local) - min(h_local)) + sum(h_local) / n / 5 >= limite \
+                and _limite_inferior_score(h_local, teto_trab, block_len, off_left,
+                                           demanda_depois[dia], dia) >= limite:
+            if eventos is not None:
+                eventos["flexibilizacoes"] += n_flex
+                eventos["extensoes_elasticas"] += n_ext
+            return dia
+
+    # -------------------------
+    # Score simples (equilíbrio de horas)
+    # -------------------------
+    score = (max(h_local) - min(h_local)) + statistics.mean(h_local) / 5
+    if eventos is not None:
+        eventos["flexibilizacoes"] += n_flex
+        eventos["extensoes_elasticas"] += n_ext
+    return score, grade, h_local, d_local, stats
+
+
+def _traduzir_tentativa(ctx, grade, h_local, d_local, stats):
+    """Índices → EscalaArray + métricas em dicts por fid."""
+    funcionarios, fids = ctx["funcionarios"], ctx["fids"]
+    ano, mes = ctx["ano"], ctx["mes"]
+    escala = EscalaArray.de_grade(grade, funcionarios,
+                                  [str_data(ano, mes, dia) for dia in range(1, len(grade) + 1)])
+    horas, dias_trab = dict(ctx["horas"]), dict(ctx["dias_trab"])
+    for i, fid in enumerate(fids):
+        horas[fid] = h_local[i]
+        dias_trab[fid] = d_local[i]
+    stats_out = {fid: {turno: stats[i * 4 + t] for t, turno in enumerate(TURNOS)} for i, fid in enumerate(fids)}
+    return {"escala": escala, "horas": horas, "stats": stats_out, "dias_trab": dias_trab,
+            "estado_final": _snapshot_ciclo(ctx, *_ciclo_final(ctx, grade))}
+
+
+# ---------- ESTADO DO CICLO ENTRE MESES (estado_final / estado_ciclo) ----------
+"""
+Snapshot compacto do ciclo de cada operador no fim do mês, alinhado com
+"operadores" (ids):
+
+    {"operadores": [...], "turno_atual": ["12H", None, ...],
+     "work_left": [...], "off_left": [...], "off_len_atual": [...],
+     "block_len": [...], "em_ferias": [0, 1, ...]}
+
+O motor devolve o da vencedora em "estado_final"; passado como
+`estado_ciclo` para o mês seguinte (payload["estado_ciclo"] no POST, ou
+automático no ano com parametros.continuidade_ciclo) ele vira o ciclo
+inicial: bloco pela metade continua, folga em curso termina, férias que
+atravessam a virada não contam como nova entrada. Quem está parado (sem
+bloco nem folga) mantém o turno do snapshot, que já é o próximo do
+CICLO_TURNOS; só recomeça sem turno se esse turno não está livre nos
+primeiros dias disponíveis do mês (_turno_indisponivel_no_inicio), senão
+um turno proibido o prenderia parado. Operadores que não estão no
+snapshot começam do zero; os que sobram no snapshot são ignorados.
+
+No ano a continuidade é o padrão (parametros.continuidade_ciclo = false
+desliga): ela evita os blocos curtos na virada do mês, mas sozinha tira o
+recomeço mensal, que é onde as horas se reequilibram (score ~30% maior no
+ano). Por isso cada mês disputa as duas partidas com metade das tentativas
+cada (_gerar_mes_continuo): fica a do ciclo herdado, salvo se o recomeço
+sair com score menor. Com o mesmo total de tentativas, o ano sai com
+score e blocos curtos menores que o recomeço mensal puro.
+
+O estado sai de _ciclo_final, que reaplica à grade final as mesmas regras
+da simulação (_fechar_dia_ciclo): vale também depois da otimização local.
+"""
 
+CAMPOS_CICLO = ("turno_atual", "work_left", "off_left", "off_len_atual", "block_len")
+
+
+def _ciclo_final(ctx, grade):
+    """Grade (índices) → (ciclo no fim do mês, férias no último dia)."""
+    n = len(ctx["fids"])
+    turno_atual, work_left, off_left, off_len_atual, block_len = (
+        array("b", ctx["ciclo0"][campo]) for campo in CAMPOS_CICLO)
+    u_turno = array("b", [SEM_TURNO] * n)
+    em_ferias_ontem = ctx["ferias_ontem0"]
+    for hoje, linha in zip(ctx["tabela_dias"], grade):
+        alocados_hoje = set()
+        for t_idx, aloc in enumerate(linha):
+            for i in aloc:
+                if turno_atual[i] == SEM_TURNO:
+                    turno_atual[i] = t_idx
+                if work_left[i] == 0:
+                    # alocado na folga (otimização local): a folga acaba aqui
+                    off_left[i] = 0
+                    _iniciar_bloco(i, turno_atual[i], work_left, off_len_atual, turno_atual,
+                                   hoje["folga"], block_len)
+                alocados_hoje.add(i)
+            for i in aloc:
+                u_turno[i] = t_idx
+                block_len[i] += 1
+        _fechar_dia_ciclo(n, alocados_hoje, hoje, em_ferias_ontem, u_turno,
+                          turno_atual, work_left, off_left, off_len_atual, block_len)
+        em_ferias_ontem = hoje["em_ferias"]
+    ciclo = dict(zip(CAMPOS_CICLO, (turno_atual, work_left, off_left, off_len_atual, block_len)))
+    return ciclo, em_ferias_ontem
+
+
+def _snapshot_ciclo(ctx, ciclo, em_ferias):
     return {
-        "consec": consec,
-        "ultimo_turno": ultimo_turno,
-        "dias_trabalhados": dias_trabalhados,
-        "pipocacoes": pipocacoes,
-        "penalidade_start": penalidade_start
+        "operadores": list(ctx["fids"]),
+        "turno_atual": [TURNOS[t] if t != SEM_TURNO else None for t in ciclo["turno_atual"]],
+        **{campo: list(ciclo[campo]) for campo in CAMPOS_CICLO[1:]},
+        "em_ferias": [int(bool(f)) for f in em_ferias],
     }
 
 
-def main(request):
-    try:
-        if request.method == "OPTIONS":
-            return ("", 204, _cors_headers())
-        if request.method != "POST":
-            return _json({"erro": "Use POST"}, status=405)
+def _turno_indisponivel_no_inicio(livre_op, t):
+    """`t` não está livre em nenhum dos BLOCK_MIN_SIZE primeiros dias em que o operador pode trabalhar."""
+    dias = [linha for linha in livre_op if any(linha)][:BLOCK_MIN_SIZE]
+    return not any(linha[t] for linha in dias)
 
-        payload       = request.get_json(force=True)
-        ano           = int(payload["ano"])
-        mes_inicio    = int(payload["mes_inicio"])
-        funcionarios  = payload["funcionarios"]
-        params        = payload.get("parametros", {})
-        tentativas    = int(params.get("quantidade_escalas", 50))
-        FLEX          = bool(params.get("permite_dupla_exp", True) and params.get("permite_dupla_aux", True))
-
-        info = {
-            "ferias":       parse_ferias(payload.get("ferias")),
-            "preferencias": parse_preferencias(payload.get("preferencias")),
-            "restricoes":   parse_restricoes(payload.get("restricoes")),
-        }
 
-        estado_continuo = None
+def _ciclo_do_snapshot(snapshot, fids, ciclo0, ferias_ontem0):
+    """estado_ciclo → (ciclo0, ferias_ontem0) na ordem de `fids`."""
+    pos = {str(fid): k for k, fid in enumerate(snapshot["operadores"])}
+    ciclo0 = {campo: array("b", valores) for campo, valores in ciclo0.items()}
+    ferias_ontem0 = list(ferias_ontem0)
+    for i, fid in enumerate(fids):
+        k = pos.get(fid)
+        if k is None:
+            continue
+        turno = snapshot["turno_atual"][k]
+        ciclo0["turno_atual"][i] = IDX_TURNO[turno] if turno else SEM_TURNO
+        for campo in CAMPOS_CICLO[1:]:
+            ciclo0[campo][i] = max(-128, min(127, int(snapshot[campo][k])))
+        ferias_ontem0[i] = bool(snapshot.get("em_ferias", [0] * len(pos))[k])
+    return ciclo0, ferias_ontem0
+
+
+# ---------- MOTOR VETORIZADO (tentativas como eixo de array) ----------
+"""
+Mesma regra do _simular_tentativa, mas N tentativas avançam juntas: todo
+estado de ciclo é uma matriz (tentativas, operadores) e cada vaga é
+resolvida por um argmin mascarado de (d_local, h_local, ruído) em todas as
+tentativas de uma vez. Como d_local/h_local só mudam no fim do dia, essa
+chave (com o ruído) é montada uma vez por dia e cada vaga só a mascara; um
+operador trabalha no máximo uma vaga por dia, então repetir o ruído entre
+as vagas do dia equivale a uma ordem aleatória de desempate por dia. Categorias de candidato (em ciclo → iniciar → sem
+turno → FLEXIBILIZAR) e preferência EXP/AUX seguem _pick_por_perfil.
+
+Com parametros.pontuacao_suave a chave da vaga passa a ser o custo
+PontuadorIncremental.custo (modelo SOFT_WEIGHTS) + ruído em [-1, 1).
+
+Ativado com parametros.motor = "vetorizado". O ruído vem de um gerador
+NumPy por lote de TAMANHO_LOTE_VETORIZADO tentativas, derivado de
+(seed, mês, início do lote): resultado reproduzível e independente do
+número de processos.
+"""
+
+TAMANHO_LOTE_VETORIZADO = 1024
+# primeiro lote do modo tempo_limite_ms; os seguintes crescem com o tempo medido
+LOTE_INICIAL_PRAZO = 32
+
+# d_local domina h_local, que domina o ruído em [0, 1)
+_PESO_DIAS = 1e6
+
+
+
+def _simular_lote_vetorizado(ctx, rng, n_tent, eventos=None):
+    """
+    Simula `n_tent` tentativas em paralelo; devolve (scores, grade, h, d, stats).
+    `eventos` como em _simular_tentativa (somado sobre o lote).
+    """
+    n, n_dias = len(ctx["fids"]), ctx["dias_no_mes"]
+    ano, mes = ctx["ano"], ctx["mes"]
+    A = n_tent
+    linhas = np.arange(A)
+    eh_exp = np.array(ctx["eh_exp"], dtype=bool)
+    livre_mes = np.array(ctx["livre"], dtype=bool).reshape(n, n_dias, len(TURNOS))
+    ferias_mes = np.array(ctx["ferias"], dtype=bool).reshape(n, n_dias)
+    prox_turno = np.array(PROX_TURNO + [SEM_TURNO], dtype=np.int8)   # [-1] → -1
+    FLEXIBILIZAR = ctx["FLEXIBILIZAR"]
+
+    h_local = np.tile(np.array(ctx["h0"], dtype=np.int32), (A, 1))
+    d_local = np.tile(np.array(ctx["d0"], dtype=np.int32), (A, 1))
+    stats = np.zeros((A, n, len(TURNOS)), dtype=np.int16)
+    u_turno = np.full((A, n), SEM_TURNO, dtype=np.int8)
+
+    ciclo0 = ctx["ciclo0"]
+    turno_atual   = np.tile(np.array(ciclo0["turno_atual"], dtype=np.int8), (A, 1))
+    work_left     = np.tile(np.array(ciclo0["work_left"], dtype=np.int8), (A, 1))
+    off_left      = np.tile(np.array(ciclo0["off_left"], dtype=np.int8), (A, 1))
+    off_len_atual = np.tile(np.array(ciclo0["off_len_atual"], dtype=np.int8), (A, 1))
+    block_len     = np.tile(np.array(ciclo0["block_len"], dtype=np.int8), (A, 1))
+
+    em_ferias_ontem = np.array(ctx["ferias_ontem0"], dtype=bool)
+    grade = np.full((A, n_dias, len(TURNOS), 2), -1, dtype=np.int16)
+    n_flex = n_ext = 0
+
+    suave = ctx.get("suave")
+    if suave is not None:
+        pont = PontuadorIncremental(ctx["fids"], dict(zip(ctx["fids"], ctx["h0"])), tentativas=A)
+        week_ant = None
+
+    for dia, hoje in enumerate(ctx["tabela_dias"], start=1):
+        folga_prox = hoje["folga"]
+        em_ferias_hoje = ferias_mes[:, dia - 1]
+        max_bloco_dia = hoje["max_bloco_dia"]
+        if suave is not None and hoje["week_id"] != week_ant:
+            pont.nova_semana()
+            week_ant = hoje["week_id"]
+
+        disp = (off_left == 0) & ~em_ferias_hoje
+        alocados = np.zeros((A, n), dtype=bool)
+        if suave is None:
+            # d_local/h_local só mudam no fim do dia: chave e ruído valem para todas as vagas
+            chave_dia = d_local * _PESO_DIAS + h_local + rng.random((A, n))
+
+        for t_idx, vagas in enumerate(hoje["vagas"]):
+            no_turno = np.zeros((A, n), dtype=bool)
+            primeiro_exp = np.ones(A, dtype=bool)
+
+            for vaga in range(vagas):
+                base = disp & ~alocados & livre_mes[:, dia - 1, t_idx]
+                # em `base` off_left == 0, então "parado" é só work_left == 0
+                em_bloco = work_left > 0
+                no_t = base & (turno_atual == t_idx)
+                em_ciclo = no_t & em_bloco
+                iniciar = no_t & ~em_bloco
+                sem_turno = base & ~em_bloco & (turno_atual == SEM_TURNO)
+
+                tem_ciclo, tem_iniciar, tem_sem = em_ciclo.any(1), iniciar.any(1), sem_turno.any(1)
+                # primeira categoria não vazia de cada tentativa
+                resto = base if FLEXIBILIZAR else np.zeros_like(base)
+                cand = em_ciclo | (~tem_ciclo[:, None] & (
+                    iniciar | (~tem_iniciar[:, None] & (sem_turno | (~tem_sem[:, None] & resto)))))
+
+                # _pick_por_perfil: EXP na 1ª vaga; na 2ª o perfil oposto ao 1º
+                if vagas == 2 and vaga == 1:
+                    prefer = cand & (eh_exp[None, :] != primeiro_exp[:, None])
+                else:
+                    prefer = cand & eh_exp[None, :]
+                cand = prefer | (cand & ~prefer.any(1)[:, None])
+
+                tem = cand.any(1)
+                if not tem.any():
+                    break
+                if FLEXIBILIZAR:
+                    n_flex += int((tem & ~(tem_ciclo | tem_iniciar | tem_sem)).sum())
+                if suave is None:
+                    chave = np.where(cand, chave_dia, np.inf)
+                else:
+                    parceiro = grade[:, dia - 1, t_idx, 0] if vaga else np.full(A, -1, dtype=np.int16)
+                    chave = pont.custo(suave, t_idx, dia, 7 - folga_prox, parceiro) + rng.uniform(-1, 1, (A, n))
+                    chave[~cand] = np.inf
+                esc = chave.argmin(1)
+
+                a, i = linhas[tem], esc[tem]
+                if vaga == 0:
+                    primeiro_exp[a] = eh_exp[i]
+                elif suave is not None:
+                    par = grade[a, dia - 1, t_idx, 0]
+                    com_par = par >= 0
+                    pont.parear(a[com_par], i[com_par], par[com_par])
+                turno_atual[a, i] = np.where(turno_atual[a, i] == SEM_TURNO, t_idx, turno_atual[a, i])
+                ini = (work_left[a, i] == 0) & (off_left[a, i] == 0)
+                work_left[a[ini], i[ini]] = 4
+                off_len_atual[a[ini], i[ini]] = folga_prox
+                block_len[a[ini], i[ini]] = 0
+                alocados[a, i] = True
+                no_turno[a, i] = True
+                grade[a, dia - 1, t_idx, vaga] = i
+                if suave is not None:
+                    pont.atribuir(a, i, t_idx)
+
+            stats[:, :, t_idx] += no_turno
+            u_turno[no_turno] = t_idx
+            block_len += no_turno   ##### ELASTIC #####  conta dia no bloco atual
+
+        # ---------- consolida quem trabalhou ----------
+        trab = alocados
+        h_local += trab * HORAS_POR_TURNO
+        d_local += trab
+        if suave is not None:
+            pont.fechar_dia(trab)
+
+        reinicia = trab & (work_left <= 0)
+        t_ini = np.where(turno_atual != SEM_TURNO, turno_atual, np.where(u_turno != SEM_TURNO, u_turno, 0))
+        turno_atual = np.where(reinicia, t_ini, turno_atual).astype(np.int8)
+        work_left[reinicia] = 4
+        off_len_atual[reinicia] = folga_prox
+        block_len[reinicia] = 0
+
+        work_left = np.where(trab, np.maximum(work_left - 1, 0), work_left).astype(np.int8)
+        fim_bloco = trab & (work_left == 0)
+        estende = fim_bloco & (block_len >= 4) & (block_len < max_bloco_dia)
+        folga = fim_bloco & ~estende
+        work_left[estende] = 1
+        n_ext += int(estende.sum())
+        off_left = np.where(folga, np.where(off_len_atual > 0, off_len_atual, folga_prox), off_left).astype(np.int8)
+        block_len[folga] = 0
+
+        # ---------- quem não trabalhou ----------
+        livre_hj = ~trab & ~em_ferias_hoje
+        entra_ferias = ~trab & (em_ferias_hoje & ~em_ferias_ontem)[None, :]
+        em_folga = livre_hj & (off_left > 0)
+        quebra = livre_hj & (off_left == 0) & (work_left > 0)
+        ocioso = livre_hj & (off_left == 0) & (work_left == 0)
+
+        turno_atual = np.where(entra_ferias, prox_turno[turno_atual], turno_atual).astype(np.int8)
+        work_left[entra_ferias] = 0
+        off_left[entra_ferias] = 0
+        off_len_atual[entra_ferias] = 0
+        block_len[entra_ferias] = 0
+
+        off_left = np.where(em_folga, off_left - 1, off_left).astype(np.int8)
+        volta = em_folga & (off_left == 0) & (turno_atual != SEM_TURNO)
+        turno_atual = np.where(volta, prox_turno[turno_atual], turno_atual).astype(np.int8)
+        off_len_atual[volta] = 0
+        block_len[volta] = 0
+
+        work_left[quebra] = 0
+        nova_folga = np.where(off_len_atual > 0, off_len_atual, 2).astype(np.int8)
+        off_left = np.where(quebra, nova_folga, off_left).astype(np.int8)
+        off_len_atual = np.where(quebra, nova_folga, off_len_atual).astype(np.int8)
+        block_len[quebra | ocioso] = 0
+
+        em_ferias_ontem = em_ferias_hoje
+
+    scores = (h_local.max(1) - h_local.min(1)) + h_local.mean(1) / 5
+    if eventos is not None:
+        eventos["flexibilizacoes"] += n_flex
+        eventos["extensoes_elasticas"] += n_ext
+    return scores, grade, h_local, d_local, stats
+
+
+def _melhor_lote_vetorizado(ctx, semente, inicio, n_tent, limite=float("inf")):
+    """
+    Lote [inicio, inicio + n_tent) → ((score, idx, (grade, h, d, stats)), contadores).
+    O lote anda em passo único, então não há poda por tentativa aqui.
+    """
+    if not ctx["fids"]:
+        return None, _contadores(n_tent)
+    cont = _contadores(n_tent)
+    lote = _rodar_lote_vetorizado(ctx, semente, inicio, n_tent, cont)
+    avisar_tentativas(n_tent, float(lote[0].min()))
+    if ctx.get("registrar_scores"):
+        cont["scores"] = lote[0].tolist()
+    if ctx.get("top_k", 1) > 1:
+        cont["top"] = [_tentativa_do_lote(lote, inicio, int(j))
+                       for j in np.argsort(lote[0], kind="stable")[:ctx["top_k"]]]
+    return _tentativa_do_lote(lote, inicio, int(lote[0].argmin())), cont
+
+
+def _rodar_lote_vetorizado(ctx, semente, inicio, n_tent, eventos=None):
+    semente_np = _rng_tentativa(semente, ctx["ano"], ctx["mes"], f"lote{inicio}").getrandbits(64)
+    return _simular_lote_vetorizado(ctx, np.random.default_rng(semente_np), n_tent, eventos=eventos)
+
+
+def _tentativa_do_lote(lote, inicio, k):
+    """Tentativa k de um lote vetorizado → (score, idx, (grade, h, d, stats))."""
+    scores, grade, h_local, d_local, stats = lote
+    grade_k = [[[int(i) for i in vagas if i >= 0] for vagas in linha] for linha in grade[k]]
+    return (float(scores[k]), inicio + k,
+            (grade_k, h_local[k].tolist(), d_local[k].tolist(), stats[k].ravel().tolist()))
+
+
+# ---------- PONTUAÇÃO SUAVE VETORIZADA (modelo SOFT_WEIGHTS no motor) ----------
+"""
+O score_func por candidato em Python é caro demais para rodar a cada vaga
+de 1000 tentativas. Aqui os mesmos termos viram uma expressão NumPy sobre a
+matriz (tentativas, operadores) inteira da vaga:
+
+    preferência de turno, balanceamento de turnos (+ ausência de turno),
+    limite_dias_mesmo_turno, meta semanal (7 - folga do modelo da semana),
+    penalidade_start do estado contínuo na janela inicial, parceiro
+    repetido, dias no mês e desequilibrio_horas.
+
+desequilibrio_horas usa h_local (horas acumuladas do ano + as do mês até
+a vaga), não as horas acumuladas fixas do início do mês como o
+score_func: é o termo que reparte as horas entre os operadores.
+
+Ficam de fora, porque no motor o ciclo (bloco fixo + folga + avanço de
+turno) já decide como regra: troca de turno (troca_de_turno e os 250 de
+troca antes de 4 dias no turno), sequência no mesmo turno
+(bonus_sequencia_mesmo_turno, bonus_seq_alvo, penaliza_seq_longa) e
+folga (penaliza_intercalado_trab_folga, bonus_folga_agrupada). Os custos
+servem para escolher a vaga, não são o score do mês: a tentativa continua
+valendo pelo score de horas do motor.
+Os termos vêm de PontuadorIncremental.custo, sobre os agregados que o motor
+mantém vaga a vaga (nada de recontar turnos por operador a cada vaga).
+Ativado com parametros.pontuacao_suave (usa o motor vetorizado).
+"""
+
+
+def _preparar_pontuacao_suave(funcionarios, info, estado_continuo):
+    """Parte invariante: preferências (n, 4) e penalidade_start (n,)."""
+    fids = [str(f["id"]) for f in funcionarios]
+    prefs = info.get("preferencias") or {}
+    pen = (estado_continuo or {}).get("penalidade_start") or {}
+    pref = np.zeros((len(fids), len(TURNOS)), dtype=bool)
+    for i, fid in enumerate(fids):
+        for turno in prefs.get(fid, ()):
+            if turno in IDX_TURNO:
+                pref[i, IDX_TURNO[turno]] = True
+    return {
+        "pref": pref,
+        "penalidade_start": np.array([float(pen.get(fid, 0)) for fid in fids]),
+    }
+
+
+# ---------- OTIMIZAÇÃO LOCAL (pós-guloso) ----------
+"""
+Busca local opcional (parametros.otimizacao_local) sobre a escala vencedora:
+
+  • troca_bloco   – dois operadores do mesmo perfil trocam blocos inteiros do
+                    mesmo turno, ou um repassa o bloco ao outro (livre naqueles
+                    dias). Muda os parceiros EXP/AUX e redistribui horas.
+  • desloca_folga – a fronteira entre dois blocos vizinhos do mesmo turno anda
+                    um dia: um bloco encolhe, o outro cresce e as janelas de
+                    folga dos dois se deslocam junto.
+
+Todo movimento é uma lista de substituições (dia, turno, sai, entra) dentro
+da mesma vaga: cobertura e composição EXP/AUX de cada turno não mudam.
+Disponibilidade é filtro, não contagem: movimento que põe alguém numa
+célula sem `livre` (férias, turno/dia/data proibidos) é descartado antes
+de qualquer conta (_entradas_disponiveis). Os demais só são aceitos se,
+regra a regra, nenhum dos dois operadores passa a ter mais violações de
+HARD_RULES / janela inicial / ciclo de blocos (_violacoes_operador) do
+que antes — trocar uma violação por outra também é recusado; a gulosa
+com FLEXIBILIZAR pode já sair com algumas — e se o score melhora, ou empata
+reduzindo violações. O score só depende das horas dos dois envolvidos: a
+variação vem do PontuadorIncremental, sem refazer o mês.
+"""
+
+OTIMIZACAO_LOCAL_PADRAO = 2000   # iterações quando parametros.otimizacao_local = true
+
+
+def _score_horas(h):
+    return (max(h) - min(h)) + statistics.mean(h) / 5
+
+
+def _blocos_operador(seq):
+    """[(inicio, fim, turno)] de cada trecho contínuo no mesmo turno (dias 0-based)."""
+    blocos, d, n = [], 0, len(seq)
+    while d < n:
+        t = seq[d]
+        if t == SEM_TURNO:
+            d += 1
+            continue
+        ini = d
+        while d + 1 < n and seq[d + 1] == t:
+            d += 1
+        blocos.append((ini, d, t))
+        d += 1
+    return blocos
+
+
+def _violacoes_operador(seq, ferias_op):
+    """
+    Violações da sequência mensal de um operador (turno ou SEM_TURNO por
+    dia), contadas por regra (Counter):
+
+      dias_consecutivos         sequência acima de limite_consecutivo(dia):
+                                MAX_SEQ_START_WINDOW na janela inicial,
+                                limite_dias_consecutivos depois
+      troca_de_turno_sem_folga  turno muda dentro da sequência
+      limite_mesmo_turno        dias no mesmo turno acima do limite
+      folga_minima              folga < 2 entre sequências
+      ciclo                     turno pós-folga fora do CICLO_TURNOS
+      bloco_curto               sequência interna menor que BLOCK_MIN_SIZE
+
+    Intervalos com férias e sequências nas bordas do mês não são cobrados.
+    Disponibilidade fica de fora: é filtro rígido (_entradas_disponiveis).
+    """
+    n = len(seq)
+    v = Counter()
+    por_turno = [0] * len(TURNOS)
+    seq_len, inicio, ult_turno, folga, houve_ferias = 0, 0, SEM_TURNO, 0, False
+
+    for d in range(n + 1):
+        t = seq[d] if d < n else SEM_TURNO
+        if t == SEM_TURNO:
+            if seq_len and seq_len < BLOCK_MIN_SIZE and inicio > 0 and d < n \
+                    and not ferias_op[d] and not ferias_op[inicio - 1]:
+                v["bloco_curto"] += 1
+            seq_len = 0
+            if d < n:
+                folga += 1
+                houve_ferias = houve_ferias or ferias_op[d]
+            continue
+
+        por_turno[t] += 1
+        if seq_len == 0:
+            inicio = d
+            if ult_turno != SEM_TURNO and not houve_ferias:
+                if folga < 2:
+                    v["folga_minima"] += 1
+                if t != PROX_TURNO[ult_turno]:
+                    v["ciclo"] += 1
+            folga, houve_ferias = 0, False
+        elif t != seq[d - 1] and HARD_RULES["troca_de_turno_sem_folga"]:
+            v["troca_de_turno_sem_folga"] += 1
+        seq_len += 1
+        if seq_len > limite_consecutivo(d + 1):
+            v["dias_consecutivos"] += 1
+        ult_turno = t
+
+    excesso = sum(max(0, c - HARD_RULES["limite_dias_mesmo_turno"]) for c in por_turno)
+    if excesso:
+        v["limite_mesmo_turno"] = excesso
+    return v
+
+
+def _piorou(antes, depois):
+    """Alguma regra passou a ter mais violações?"""
+    return any(c > antes[regra] for regra, c in depois.items())
+
+
+def _entradas_disponiveis(subs, livre, ferias):
+    """Todo operador que entra numa célula está livre nela (e fora de férias)."""
+    return all(livre[entra][d][t] and not ferias[entra][d] for d, t, _, entra in subs)
+
+
+def _mov_troca_bloco(seq, a, b, bloco, rng):
+    s, e, t = bloco
+    livre_b = all(seq[b][d] == SEM_TURNO for d in range(s, e + 1))
+    opcoes = [
+        (s2, e2) for s2, e2, t2 in _blocos_operador(seq[b])
+        if t2 == t and livre_b and (e2 < s or s2 > e)
+        and all(seq[a][d] == SEM_TURNO for d in range(s2, e2 + 1))
+    ]
+    if livre_b:
+        opcoes.append(None)   # repasse sem contrapartida
+    if not opcoes:
+        return None
+    outro = rng.choice(opcoes)
+    subs = [(d, t, a, b) for d in range(s, e + 1)]
+    if outro:
+        subs += [(d, t, b, a) for d in range(outro[0], outro[1] + 1)]
+    return subs
+
+
+def _mov_desloca_folga(seq, a, b, bloco):
+    s, e, t = bloco
+    n = len(seq[a])
+    if s > 0 and seq[b][s - 1] == t and seq[b][s] == SEM_TURNO:
+        return [(s, t, a, b)]          # b estende o bloco dele sobre o 1º dia de a
+    if e + 1 < n and seq[b][e + 1] == t and seq[b][e] == SEM_TURNO:
+        return [(e, t, a, b)]          # b antecipa o bloco dele sobre o último dia de a
+    return None
+
+
+def _otimizar_local(ctx, grade, h_local, d_local, stats, rng, iteracoes):
+    """Melhora a escala por movimentos locais; devolve (grade, h, d, stats, relatório)."""
+    fids, n_dias = ctx["fids"], ctx["dias_no_mes"]
+    n = len(fids)
+    eh_exp, livre, ferias = ctx["eh_exp"], ctx["livre"], ctx["ferias"]
+
+    grade = [[list(ops) for ops in linha] for linha in grade]
+    pont = PontuadorIncremental(fids, dict(zip(fids, h_local)), dias=dict(zip(fids, d_local)),
+                                por_turno={fid: stats[i * 4:i * 4 + 4] for i, fid in enumerate(fids)})
+    h = pont.h[0]
+    seq = [[SEM_TURNO] * n_dias for _ in range(n)]
+    for d, linha in enumerate(grade):
+        for t, ops in enumerate(linha):
+            for i in ops:
+                seq[i][d] = t
+    viol = [_violacoes_operador(seq[i], ferias[i]) for i in range(n)]
+    por_perfil = {p: [i for i in range(n) if eh_exp[i] == p] for p in (True, False)}
+
+    score_inicial = pont.score()
+    variancia_inicial = pont.variancia()
+    aceitos = {"troca_bloco": 0, "desloca_folga": 0}
+
+    def aplicar(subs, reverso=False):
+        for d, t, sai, entra in subs:
+            if reverso:
+                sai, entra = entra, sai
+            seq[sai][d], seq[entra][d] = SEM_TURNO, t
+            pont.mover(t, sai, entra)
+
+    for _ in range(iteracoes if n > 1 else 0):
+        # metade dos movimentos mira quem define o score: o mais carregado
+        # cede trabalho ao menos carregado do mesmo perfil
+        if rng.random() < 0.5:
+            topo = max(h)
+            a = rng.choice([i for i in range(n) if h[i] == topo])
+            b = min(por_perfil[eh_exp[a]], key=lambda i: (h[i], rng.random()))
+        else:
+            a = rng.randrange(n)
+            b = rng.choice(por_perfil[eh_exp[a]])
+        blocos_a = _blocos_operador(seq[a])
+        if not blocos_a or b == a:
+            continue
+        bloco = rng.choice(blocos_a)
+        if rng.random() < 0.5:
+            tipo, subs = "troca_bloco", _mov_troca_bloco(seq, a, b, bloco, rng)
+        else:
+            tipo, subs = "desloca_folga", _mov_desloca_folga(seq, a, b, bloco)
+        if not subs or not _entradas_disponiveis(subs, livre, ferias):
+            continue
+
+        horas_mov = Counter()
+        for _, _, sai, entra in subs:
+            horas_mov[sai] -= HORAS_POR_TURNO
+            horas_mov[entra] += HORAS_POR_TURNO
+        delta = pont.delta_score(horas_mov)
+        if delta > 0:
+            continue
+
+        aplicar(subs)
+        va = _violacoes_operador(seq[a], ferias[a])
+        vb = _violacoes_operador(seq[b], ferias[b])
+        menos_viol = sum(va.values()) + sum(vb.values()) < sum(viol[a].values()) + sum(viol[b].values())
+        if not _piorou(viol[a], va) and not _piorou(viol[b], vb) and (delta < 0 or menos_viol):
+            pont.aplicar_horas(horas_mov)
+            viol[a], viol[b] = va, vb
+            aceitos[tipo] += 1
+            for d, t, sai, entra in subs:
+                vaga = grade[d][t]
+                vaga[vaga.index(sai)] = entra
+        else:
+            aplicar(subs, reverso=True)
+
+    relatorio = {
+        "iteracoes": iteracoes,
+        "aceitos": aceitos,
+        "score_inicial": score_inicial,
+        "score_final": pont.score(),
+        "variancia_horas": {"inicial": variancia_inicial, "final": pont.variancia()},
+    }
+    return grade, h.tolist(), pont.dias_mes[0].tolist(), pont.por_turno[0].ravel().tolist(), relatorio
+
+
+# ---------- EXECUÇÃO DAS TENTATIVAS (serial ou pool de processos) ----------
+
+_CTX_WORKER = None
+
+
+def _init_worker(ctx):
+    """Inicializador do pool: o contexto é enviado uma única vez por processo."""
+    global _CTX_WORKER
+    _CTX_WORKER = ctx
+
+
+def _rodar_no_worker(fn, args):
+    return fn(_CTX_WORKER, *args)
+
+
+def _contadores(tentativas=0):
+    return {"tentativas": tentativas, "podadas": 0, "podas_por_dia": {},
+            "flexibilizacoes": 0, "extensoes_elasticas": 0}
+
+
+def _somar_contadores(total, parcial):
+    for chave, valor in parcial.items():
+        if isinstance(valor, list):
+            total.setdefault(chave, []).extend(valor)
+        elif isinstance(valor, dict):
+            destino = total.setdefault(chave, {})
+            for k, v in valor.items():
+                destino[k] = destino.get(k, 0) + v
+        else:
+            total[chave] = total.get(chave, 0) + valor
+    return total
+
+
+def _melhor_do_lote(ctx, semente, inicio, n_tent, limite=float("inf")):
+    """
+    Roda as tentativas [inicio, inicio + n_tent) e devolve
+    ((score, idx, resultado) da melhor, contadores).
+    Empate em score fica com o menor índice, igual ao laço serial.
+
+    `limite` é o score a bater vindo de fora do lote; dentro do lote ele cai
+    para o melhor score já visto. Uma tentativa podada teria score >= esse
+    limite e, portanto, nunca seria a vencedora: o resultado não muda.
+
+    Com ctx["registrar_scores"] (parada adaptativa) contadores["scores"] traz
+    o score de cada tentativa do lote, em ordem, com None para as podadas.
+    Com ctx["top_k"] > 1 contadores["top"] guarda as k melhores do lote e a
+    poda passa a usar a k-ésima como limite.
+    """
+    melhor, cont = None, _contadores(n_tent)
+    registro = cont.setdefault("scores", []) if ctx.get("registrar_scores") else None
+    k = ctx.get("top_k", 1)
+    top = cont.setdefault("top", []) if k > 1 else None
+    for idx in range(inicio, inicio + n_tent):
+        if top is None:
+            corte = min(limite, melhor[0]) if melhor else limite
+        else:
+            corte = min(limite, top[-1][0]) if len(top) == k else limite
+        res = _simular_tentativa(ctx, _rng_tentativa(semente, ctx["ano"], ctx["mes"], idx),
+                                 limite=corte, eventos=cont)
+        avisar_tentativas(1, res[0] if isinstance(res, tuple) else None)
+        if registro is not None:
+            registro.append(res[0] if isinstance(res, tuple) else None)
+        if res is None:
+            continue
+        if isinstance(res, int):
+            cont["podadas"] += 1
+            cont["podas_por_dia"][res] = cont["podas_por_dia"].get(res, 0) + 1
+            continue
+        if top is not None:
+            top.append((res[0], idx, res[1:]))
+            top.sort(key=_ordem_tentativa)
+            del top[k:]
+        if melhor is None or res[0] < melhor[0]:
+            melhor = (res[0], idx, res[1:])
+    return melhor, cont
+
+
+def _ordem_tentativa(t):
+    return t[0], t[1]
+
+
+def _limite_externo(melhor, cont, k):
+    """Score a bater nos próximos lotes: o melhor, ou o k-ésimo melhor com top_k."""
+    if k <= 1:
+        return melhor[0] if melhor else float("inf")
+    top = cont.get("top", [])
+    return top[k - 1][0] if len(top) >= k else float("inf")
+
+
+def _melhor_ate_prazo(ctx, fn, semente, primeiro, passo, tamanho, prazo):
+    """
+    Modo anytime: percorre as faixas primeiro, primeiro + passo, ... (cada uma
+    com `tamanho` índices de tentativa) até `prazo` (time.time() absoluto).
+
+    Cada faixa roda em lotes cujo tamanho segue o tempo restante: o primeiro
+    tem LOTE_INICIAL_PRAZO tentativas e os seguintes no máximo dobram, sem
+    passar do que o tempo por tentativa já medido cabe até o prazo. Assim um
+    orçamento pequeno não é estourado por um lote inteiro do vetorizado.
+    O primeiro lote sempre roda, então há ao menos uma escala mesmo com
+    orçamento estourado.
+    """
+    melhor, cont, faixa = None, _contadores(), primeiro
+    k = ctx.get("top_k", 1)
+    n_lote, por_tentativa = min(tamanho, LOTE_INICIAL_PRAZO), None
+    while True:
+        feito = 0
+        while feito < tamanho:
+            if por_tentativa is not None:
+                cabe = int((prazo - time.time()) / por_tentativa) if por_tentativa > 0 else tamanho
+                n_lote = max(1, min(2 * n_lote, cabe))
+            n = min(n_lote, tamanho - feito)
+            t0 = time.time()
+            parcial, c = fn(ctx, semente, faixa * tamanho + feito, n, limite=_limite_externo(melhor, cont, k))
+            por_tentativa = (time.time() - t0) / n
+            feito += n
+            _somar_contadores(cont, c)
+            if k > 1:
+                cont["top"] = sorted(cont["top"], key=_ordem_tentativa)[:k]
+            if parcial is not None and (melhor is None or (parcial[0], parcial[1]) < (melhor[0], melhor[1])):
+                melhor = parcial
+            if time.time() >= prazo:
+                return melhor, cont
+        faixa += passo
+
+
+def _resolver_processos(processos):
+    """`processos`: int, "auto" (= CPUs da máquina) ou vazio (= serial)."""
+    if processos in (None, "", 0, 1, "1"):
+        return 1
+    if processos == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(processos))
+
+
+def _executar_tarefas(ctx, fn, tarefas, processos):
+    """
+    fn(ctx, *args) → (melhor, contadores) para cada args de `tarefas`, em série
+    ou num pool. Reduz ao menor (score, índice) e soma os contadores;
+    a ordem de execução não influencia o vencedor.
+    """
+    if processos == 1:
+        parciais = [fn(ctx, *args) for args in tarefas]
+    else:
+        parciais = []
+        with ProcessPoolExecutor(max_workers=processos, initializer=_init_worker, initargs=(ctx,)) as pool:
+            for parcial, c in pool.map(_rodar_no_worker, [fn] * len(tarefas), tarefas):
+                # nos workers não há acompanhamento: o pai avisa a cada lote devolvido
+                avisar_tentativas(c["tentativas"], parcial[0] if parcial is not None else None)
+                parciais.append((parcial, c))
+    validos = [p for p, _ in parciais if p is not None]
+    melhor = min(validos, key=lambda p: (p[0], p[1])) if validos else None
+    cont = _contadores()
+    for _, c in parciais:
+        _somar_contadores(cont, c)
+    return melhor, cont
+
+
+# ---------- PARADA ADAPTATIVA (convergência do melhor score) ----------
+"""
+parametros.parada_adaptativa = true | {"janela": K, "epsilon": ε, "taxa_minima": r}
+
+`tentativas` vira o teto. As tentativas rodam em rodadas (um lote por
+processo) e, ao fim de cada rodada, os scores são percorridos em ordem de
+índice; o motor para na primeira tentativa j em que
+
+  • nenhuma melhora maior que ε aconteceu nas últimas K tentativas, ou
+  • (melhor[j - K] - melhor[j]) / K < taxa_minima (se informada).
+
+A vencedora é a melhor entre as tentativas 0..j; o que a rodada rodou
+depois de j é descartado. Como a poda só corta tentativas que não seriam
+melhora, a sequência de melhoras (e portanto j e a vencedora) não depende
+do tamanho das rodadas nem do número de processos. Se a melhor de 0..j não
+é a melhor da rodada, ela é re-simulada a partir do próprio índice.
+
+A curva (índice, melhor score) a cada melhora sai em "convergencia".
+"""
+
+PARADA_ADAPTATIVA_PADRAO = {"janela": 50, "epsilon": 0.0, "taxa_minima": None}
+
+
+def _opcoes_parada_adaptativa(params):
+    opcoes = (params or {}).get("parada_adaptativa")
+    if not opcoes:
+        return None
+    opcoes = {**PARADA_ADAPTATIVA_PADRAO, **({} if opcoes is True else opcoes)}
+    return {
+        "janela": max(1, int(opcoes["janela"])),
+        "epsilon": float(opcoes["epsilon"]),
+        "taxa_minima": None if opcoes["taxa_minima"] is None else float(opcoes["taxa_minima"]),
+    }
+
+
+def _reproduzir_tentativa(ctx, semente, idx, vetorizado, inicio_lote, tamanho_lote):
+    """Refaz a tentativa `idx` sem poda → (score, idx, (grade, h, d, stats))."""
+    if vetorizado:
+        lote = _rodar_lote_vetorizado(ctx, semente, inicio_lote, tamanho_lote)
+        return _tentativa_do_lote(lote, inicio_lote, idx - inicio_lote)
+    res = _simular_tentativa(ctx, _rng_tentativa(semente, ctx["ano"], ctx["mes"], idx))
+    return res[0], idx, res[1:]
+
+
+def _executar_adaptativo(ctx, fn_lote, semente, maximo, processos, opcoes, vetorizado):
+    """Tentativas até convergir (ou até `maximo`) → (melhor, contadores, convergencia)."""
+    janela, eps, taxa = opcoes["janela"], opcoes["epsilon"], opcoes["taxa_minima"]
+    ctx = {**ctx, "registrar_scores": True}
+    # lotes em grade fixa (múltiplos de `tamanho`): a semente de um lote vetorizado depende do início
+    tamanho = min(TAMANHO_LOTE_VETORIZADO, janela) if vetorizado else max(1, janela // 4)
+
+    vencedor, cont = None, _contadores()
+    melhor_score, melhor_idx, ultima_melhora = float("inf"), None, -1
+    historico, curva = [], []
+    parou_em, motivo, proximo = None, "teto", 0
+    while proximo < maximo and parou_em is None:
+        inicios = range(proximo, min(maximo, proximo + tamanho * processos), tamanho)
+        corte = _limite_externo((melhor_score,) if melhor_idx is not None else None, cont, ctx.get("top_k", 1))
+        tarefas = [(semente, ini, min(tamanho, maximo - ini), corte) for ini in inicios]
+        melhor_rodada, c = _executar_tarefas(ctx, fn_lote, tarefas, min(processos, len(tarefas)))
+        scores = c.pop("scores")
+        _somar_contadores(cont, c)
+        if "top" in cont:
+            cont["top"].sort(key=_ordem_tentativa)   # sem truncar: o corte em j vem no fim
+
+        for k, score in enumerate(scores):
+            idx = proximo + k
+            if score is not None and score < melhor_score:
+                if melhor_score - score > eps:
+                    ultima_melhora = idx
+                melhor_score, melhor_idx = score, idx
+                curva.append([idx + 1, round(score, 4)])
+            historico.append(melhor_score)
+            if idx - ultima_melhora >= janela:
+                parou_em, motivo = idx, "estagnacao"
+            elif taxa is not None and idx >= janela \
+                    and (historico[idx - janela] - melhor_score) / janela < taxa:
+                parou_em, motivo = idx, "taxa"
+            if parou_em is not None:
+                break
+        proximo += len(scores)
+
+        if melhor_idx is None or (vencedor is not None and vencedor[1] == melhor_idx):
+            continue
+        if melhor_rodada is not None and melhor_rodada[1] == melhor_idx:
+            vencedor = melhor_rodada
+        else:
+            inicio_lote = melhor_idx - melhor_idx % tamanho
+            vencedor = _reproduzir_tentativa(ctx, semente, melhor_idx, vetorizado,
+                                             inicio_lote, min(tamanho, maximo - inicio_lote))
+
+    convergencia = {
+        **opcoes,
+        "motivo": motivo,
+        "parou_em": (parou_em + 1) if parou_em is not None else proximo,
+        "curva": curva,
+    }
+    if "top" in cont:
+        cont["top"] = [t for t in cont["top"] if t[1] < convergencia["parou_em"]]
+    return vencedor, cont, convergencia
+
+
+def motor_gerar_dias_mes(ano, mes, funcionarios, params, info,
+                         estado_acumulado=None, estado_continuo=None,
+                         FLEXIBILIZAR=True, tentativas=50, perfis=None,
+                         mes_acum_horas=None, processos=1, tempo_limite_ms=None,
+                         top_k=1, estado_ciclo=None):
+    """
+    Motor gerador puro: devolve grade crua + métricas.
+
+    PRINCÍPIO BASE (4x1 / 4x2 / 4x3):
+      - Todo bloco de TRABALHO é FIXO: 4 dias no mesmo turno.
+      - Ao terminar o bloco, entra em FOLGA (2 ou 3 dias) definida no INÍCIO do ciclo.
+      - Ao terminar folga, avança turno no CICLO: 00 -> 18 -> 12 -> 06 -> 00.
+      - O MODELO (4x1/4x2/4x3) é escolhido POR SEMANA, baseado em ATIVOS reais.
+
+    ELASTICIDADE 2025‑12‑18:
+      - Se houver escassez, o bloco pode ser estendido explicitamente para 5 ou 6 dias.
+      - A decisão é diária, conforme pressão calculada antes da alocação.
+      - Nenhum operador excede 6 dias consecutivos.
+
+    TENTATIVAS / PARALELISMO:
+      - Cada tentativa usa um gerador aleatório próprio derivado de
+        (parametros.seed, ano, mês, índice da tentativa).
+      - Com `processos` > 1 as tentativas são divididas em lotes contíguos
+        num ProcessPoolExecutor; o pai fica com o menor (score, índice).
+      - Para a mesma seed o resultado é idêntico com qualquer nº de processos.
+      - parametros.motor = "vetorizado" troca a simulação uma-a-uma pelo
+        _simular_lote_vetorizado (mesmas regras, tentativas em lote NumPy).
+      - parametros.pontuacao_suave escolhe cada vaga pelo modelo SOFT_WEIGHTS
+        (PontuadorIncremental.custo) em vez de só dias/horas; implica o motor vetorizado.
+
+    ORÇAMENTO DE TEMPO:
+      - Com `tempo_limite_ms` o motor ignora `tentativas` e gera tentativas
+        até o prazo, devolvendo a melhor até ali (sempre ao menos um lote).
+      - `tentativas_realizadas` informa quantas rodaram de fato.
+
+    PODA (parametros.poda, padrão ligado):
+      - Tentativas que já não podem bater a melhor são abandonadas nos
+        últimos PODA_DIAS_FINAIS dias do mês (ver _limite_inferior_score);
+        `podas` conta quantas e em que dia.
+      - Não altera a vencedora. Poupa pouco tempo: o score de horas ainda
+        pode se nivelar até perto do fim do mês.
+
+    PARADA ADAPTATIVA (parametros.parada_adaptativa):
+      - `tentativas` vira teto: para quando o melhor score deixa de melhorar
+        mais que ε nas últimas K tentativas (ver _executar_adaptativo).
+      - Determinística como o modo fixo; a curva vem em `convergencia`.
+      - Ignorada quando há `tempo_limite_ms`.
+
+    OTIMIZAÇÃO LOCAL (parametros.otimizacao_local = true | nº de iterações):
+      - A vencedora passa por _otimizar_local antes de sair; o relatório
+        vem em `otimizacao_local`.
+
+    CONTINUIDADE DO CICLO:
+      - `estado_final` é o snapshot do ciclo de cada operador no fim do mês
+        (turno_atual, work_left, off_left, off_len_atual, block_len, férias).
+      - `estado_ciclo` (o estado_final do mês anterior) faz o mês começar
+        exatamente dali; tem precedência sobre `estado_continuo`.
+
+    ALTERNATIVAS (top_k > 1):
+      - `alternativas` traz as top_k melhores tentativas distintas, a
+        vencedora primeiro (já com otimização local, se houver), cada uma
+        com escala / horas / stats / dias_trab / score / tentativa.
+      - A poda passa a usar a k-ésima melhor como limite.
+
+    MÉTRICAS (parametros.metricas):
+      - Tentativas rodadas/podadas/mantidas, fallbacks FLEXIBILIZAR e
+        extensões elásticas de todas as tentativas vão para contar().
+    """
+    funcionarios = [f for f in funcionarios if f.get("perfil") in ("EXP", "AUX")]
+
+    ctx = _preparar_contexto_motor(ano, mes, funcionarios, info, estado_acumulado,
+                                   estado_continuo, FLEXIBILIZAR, estado_ciclo)
+    ctx["poda"] = bool((params or {}).get("poda", True))
+    ctx["top_k"] = max(1, int(top_k))
+    semente = _semente_base(params)
+    if (params or {}).get("pontuacao_suave"):
+        ctx["suave"] = _preparar_pontuacao_suave(funcionarios, info, estado_continuo)
+    vetorizado = (params or {}).get("motor") == "vetorizado" or "suave" in ctx
+    fn_lote = _melhor_lote_vetorizado if vetorizado else _melhor_do_lote
+    adaptativa = _opcoes_parada_adaptativa(params)
+    convergencia = None
+
+    if tempo_limite_ms is not None:
+        # cada processo k roda as faixas k, k + P, k + 2P ... até o prazo
+        processos = _resolver_processos(processos)
+        prazo = time.time() + float(tempo_limite_ms) / 1000
+        tamanho = TAMANHO_LOTE_VETORIZADO if vetorizado else 1
+        tarefas = [(fn_lote, semente, k, processos, tamanho, prazo) for k in range(processos)]
+        melhor, cont = _executar_tarefas(ctx, _melhor_ate_prazo, tarefas, processos)
+    elif adaptativa:
+        processos = min(_resolver_processos(processos), max(1, tentativas))
+        melhor, cont, convergencia = _executar_adaptativo(ctx, fn_lote, semente, tentativas,
+                                                          processos, adaptativa, vetorizado)
+    elif vetorizado:
+        processos = min(_resolver_processos(processos), max(1, tentativas))
+        tarefas = [(semente, ini, min(TAMANHO_LOTE_VETORIZADO, tentativas - ini))
+                   for ini in range(0, tentativas, TAMANHO_LOTE_VETORIZADO)]
+        melhor, cont = _executar_tarefas(ctx, fn_lote, tarefas, processos)
+    else:
+        processos = min(_resolver_processos(processos), max(1, tentativas))
+        # ~4 lotes por processo equilibra carga sem inflar o custo de IPC
+        n_lotes = min(tentativas, processos * 4) if processos > 1 else 1
+        limites = [tentativas * k // n_lotes for k in range(n_lotes + 1)]
+        tarefas = [(semente, a, b - a) for a, b in zip(limites, limites[1:])]
+        melhor, cont = _executar_tarefas(ctx, fn_lote, tarefas, processos)
+
+    resumo = {
+        "tentativas_realizadas": cont["tentativas"],
+        "podas": {
+            "total": cont["podadas"],
+            "por_dia": {d: cont["podas_por_dia"][d] for d in sorted(cont["podas_por_dia"])},
+        },
+        **({"convergencia": convergencia} if convergencia else {}),
+    }
+    contar(tentativas=cont["tentativas"], podadas=cont["podadas"],
+           mantidas=cont["tentativas"] - cont["podadas"],
+           flexibilizacoes=cont["flexibilizacoes"], extensoes_elasticas=cont["extensoes_elasticas"])
+    if melhor is None:
+        return {"escala": None, "score": float("inf"), **resumo}
+
+    melhor_score, melhor_idx, (grade, h_local, d_local, stats) = melhor
+
+    iteracoes = (params or {}).get("otimizacao_local")
+    if iteracoes:
+        iteracoes = OTIMIZACAO_LOCAL_PADRAO if iteracoes is True else int(iteracoes)
+        grade, h_local, d_local, stats, resumo["otimizacao_local"] = _otimizar_local(
+            ctx, grade, h_local, d_local, stats,
+            _rng_tentativa(semente, ano, mes, "otimizacao_local"), iteracoes)
+        melhor_score = resumo["otimizacao_local"]["score_final"]
+
+    vencedora = {**_traduzir_tentativa(ctx, grade, h_local, d_local, stats), "score": melhor_score}
+    if ctx["top_k"] > 1:
+        outras = [t for t in sorted(cont.get("top", []), key=_ordem_tentativa) if t[1] != melhor_idx]
+        resumo["alternativas"] = [{**vencedora, "tentativa": melhor_idx}] + [
+            {**_traduzir_tentativa(ctx, *dados), "score": score, "tentativa": idx}
+            for score, idx, dados in outras[:ctx["top_k"] - 1]
+        ]
+
+    return {**vencedora, **resumo}
+
+# ========================
+# RELATÓRIO / PARECER (MANTER COMO HOJE)
+# ========================
+def gerar_parecer_escala(dias, funcionarios):
+    """
+    Parecer a partir de `dias_out` (nomes), via EscalaArray.from_json (o
+    primeiro funcionário com o nome vence, como antes; nomes desconhecidos
+    são ignorados).
+    """
+    return parecer_da_escala(EscalaArray.from_json(dias, funcionarios))
+
+
+def parecer_da_escala(escala):
+    """
+    Mesmo parecer numa única passada sobre uma EscalaArray, com contadores
+    em arrays por índice de operador.
+    """
+    funcionarios = escala.funcionarios
+    n = len(funcionarios)
+    dias_trab = array("i", [0] * n)
+    vezes     = array("i", [0] * (n * len(TURNOS)))   # vezes[i * 4 + t]
+    turnos_total = array("i", [0] * n)
+    maior_seq = array("i", [0] * n)
+    menor_seq = array("i", [0] * n)                   # 0 = ainda sem sequência
+    trocas    = array("i", [0] * n)
+    ult         = array("b", [SEM_TURNO] * n)
+    seq_trab    = array("i", [0] * n)
+    seq_t_mesmo = array("i", [0] * n)
+    trabalhou_em = array("i", [0] * n)                # último dia (1-based) trabalhado
+
+    def fecha_seq_mesmo(i):
+        if seq_t_mesmo[i] and (not menor_seq[i] or seq_t_mesmo[i] < menor_seq[i]):
+            menor_seq[i] = seq_t_mesmo[i]
+
+    for dia, linha in enumerate(escala.dados.tolist(), start=1):
+        for t, dupla in enumerate(linha):
+            for i in dupla:
+                if i < 0:
+                    continue
+                if trabalhou_em[i] != dia:
+                    dias_trab[i] += 1
+                    trabalhou_em[i] = dia
+                vezes[i * 4 + t] += 1
+                turnos_total[i] += 1
+
+                if ult[i] == t:
+                    seq_t_mesmo[i] += 1
+                else:
+                    fecha_seq_mesmo(i)
+                    seq_t_mesmo[i] = 1
+                    if ult[i] != SEM_TURNO:
+                        trocas[i] += 1
+                ult[i] = t
+
+        for i in range(n):
+            if trabalhou_em[i] == dia:
+                seq_trab[i] += 1
+                if seq_trab[i] > maior_seq[i]:
+                    maior_seq[i] = seq_trab[i]
+            else:
+                fecha_seq_mesmo(i)
+                seq_trab[i] = seq_t_mesmo[i] = 0
+
+    return [
+        {
+            "funcionario_id": f["id"],
+            "nome":           f.get("nome"),
+            "dias_trabalhados": dias_trab[i],
+            "dias_folga":       len(escala) - dias_trab[i],
+            "total_horas":      HORAS_POR_TURNO * turnos_total[i],
+            "vezes_00h":        vezes[i * 4],
+            "vezes_06h":        vezes[i * 4 + 1],
+            "vezes_12h":        vezes[i * 4 + 2],
+            "vezes_18h":        vezes[i * 4 + 3],
+            "maior_seq_dias_trab":          maior_seq[i],
+            "menor_seq_dias_mesmo_turno":  menor_seq[i] or 1,
+            "trocas_de_turno":              trocas[i],
+        }
+        for i, f in enumerate(funcionarios)
+    ]
+
+
+def resumo_anual(escala):
+    """
+    Relatório do período inteiro numa passada vetorizada sobre uma
+    EscalaArray (meses concatenados): horas, turnos por tipo, dias trabalhados/folga, maior
+    sequência de dias trabalhados (atravessando a virada do mês) e trocas de
+    turno (mesma definição do parecer: turno diferente do último trabalhado).
+    """
+    funcionarios = escala.funcionarios
+    n = len(funcionarios)
+    n_dias, n_turnos, _ = escala.dados.shape
+
+    # X[d * 4 + t, i] = operador i trabalhou no turno t do dia d
+    X = escala.ocupacao()
+
+    por_turno = X.reshape(n_dias, n_turnos, n).sum(0)          # (4, n)
+    trab = X.reshape(n_dias, n_turnos, n).any(1)               # (dias, n)
+
+    # maior sequência: contagem acumulada reiniciada em cada dia de folga
+    acum = np.cumsum(trab, axis=0)
+    base = np.maximum.accumulate(np.where(trab, 0, acum), axis=0)
+    maior_seq = (acum - base).max(0) if n_dias else np.zeros(n, dtype=int)
+
+    # trocas: posição (dia, turno) do último trabalho anterior a cada trabalho
+    pos = np.arange(n_dias * n_turnos)[:, None]
+    ultima = np.maximum.accumulate(np.where(X, pos, -1), axis=0)
+    anterior = np.vstack([np.full((1, n), -1), ultima[:-1]])
+    trocas = (X & (anterior >= 0) & (anterior % n_turnos != pos % n_turnos)).sum(0)
+
+    dias_trab = trab.sum(0)
+    total_turnos = por_turno.sum(0)
+    return {
+        "dias": n_dias,
+        "funcionarios": [
+            {
+                "funcionario_id": f["id"],
+                "nome":           f.get("nome"),
+                "total_horas":      int(total_turnos[i]) * HORAS_POR_TURNO,
+                "dias_trabalhados": int(dias_trab[i]),
+                "dias_folga":       n_dias - int(dias_trab[i]),
+                **{f"vezes_{turno.lower()}": int(por_turno[t, i]) for t, turno in enumerate(TURNOS)},
+                "maior_seq_dias_trab": int(maior_seq[i]),
+                "trocas_de_turno":     int(trocas[i]),
+            }
+            for i, f in enumerate(funcionarios)
+        ],
+    }
+
+
+# ========================
+# GERADORES (MÊS/ANO) – CASCA
+# ========================
+def gerar_escala_mes(ano, mes, funcionarios, params, info,
+                     estado_acumulado=None, FLEXIBILIZAR=True,
+                     tentativas=50, perfis=None, mes_acum_horas=None,
+                     estado_continuo=None, processos=1, tempo_limite_ms=None,
+                     incluir_grade=False, top_k=1, estado_ciclo=None):
+    """
+    Casca fina: prepara, chama motor, formata saída e parecer.
+    `incluir_grade` devolve também a EscalaArray do mês em "grade" (uso interno).
+    Com `top_k` > 1, "alternativas" traz as outras k-1 melhores no mesmo
+    formato (uso interno: busca em feixe do ano).
+    """
+    funcionarios = [f for f in funcionarios if f.get("perfil") in ("EXP", "AUX")]
+
+    periodo = f"{ano}-{parse_mes(mes)}"
+    with medir(f"motor:{periodo}"):
+        res_motor = motor_gerar_dias_mes(
+            ano, mes, funcionarios, params, info,
+            estado_acumulado=estado_acumulado,
+            estado_continuo=estado_continuo,
+            FLEXIBILIZAR=FLEXIBILIZAR,
+            tentativas=tentativas,
+            perfis=perfis,
+            mes_acum_horas=mes_acum_horas,
+            processos=processos,
+            tempo_limite_ms=tempo_limite_ms,
+            top_k=top_k,
+            estado_ciclo=estado_ciclo,
+        )
+
+    extras = {
+        "tentativas_realizadas": res_motor["tentativas_realizadas"],
+        "podas":   res_motor["podas"],
+        **({"otimizacao_local": res_motor["otimizacao_local"]} if "otimizacao_local" in res_motor else {}),
+        **({"convergencia": res_motor["convergencia"]} if "convergencia" in res_motor else {}),
+    }
+    saida = _saida_mes(periodo, res_motor, extras, incluir_grade)
+    print(f"\033[92mMelhor score {ano}-{parse_mes(mes)}: {res_motor['score']:.2f}\033[0m")
+
+    if "alternativas" in res_motor:
+        saida["alternativas"] = [_saida_mes(periodo, alt, extras, incluir_grade)
+                                 for alt in res_motor["alternativas"][1:]]
+    return saida
+
+
+def _saida_mes(periodo, res, extras, incluir_grade):
+    """Resultado do motor (vencedora ou alternativa) → JSON do mês."""
+    escala = res["escala"]
+    dias_out = escala.to_json()
+
+    # parecer direto da EscalaArray da vencedora, sem voltar aos nomes de dias_out
+    with medir(f"parecer:{periodo}"):
+        parecer = parecer_da_escala(escala)
+
+    return {
+        "dias":    dias_out,
+        "horas":   res["horas"],
+        "stats":   res["stats"],
+        "dias_trab": res["dias_trab"],
+        "score":   res["score"],
+        "parecer": parecer,
+        "estado_final": res["estado_final"],
+        **extras,
+        **({"grade": escala} if incluir_grade else {}),
+    }
+
+
+def _continuidade_ciclo(params):
+    """parametros.continuidade_ciclo, ligada por padrão."""
+    return _flag_ligada((params or {}).get("continuidade_ciclo", True))
+
+
+def _gerar_mes_continuo(ano, mes, funcionarios, params, info, estado_ciclo=None,
+                        tentativas=50, tempo_limite_ms=None, **kw):
+    """
+    Mês do ano com o ciclo herdado → (saída do ciclo herdado, saída do
+    recomeço ou None). Cada partida fica com metade das tentativas e do
+    prazo; sem `estado_ciclo` (ou com uma tentativa só) roda só a primeira.
+    """
+    if not estado_ciclo or tentativas < 2:
+        return gerar_escala_mes(ano, mes, funcionarios, params, info, tentativas=tentativas,
+                                tempo_limite_ms=tempo_limite_ms, estado_ciclo=estado_ciclo, **kw), None
+    metade = tentativas // 2
+    limite = tempo_limite_ms / 2 if tempo_limite_ms is not None else None
+    herdado = gerar_escala_mes(ano, mes, funcionarios, params, info, tentativas=tentativas - metade,
+                               tempo_limite_ms=limite, estado_ciclo=estado_ciclo, **kw)
+    recomeco = gerar_escala_mes(ano, mes, funcionarios, params, info, tentativas=metade,
+                                tempo_limite_ms=limite, **kw)
+    return herdado, recomeco
+
+
+# ---------- BUSCA EM FEIXE ENTRE MESES (parametros.feixe) ----------
+"""
+O ano guloso escolhe a melhor escala de cada mês e segue; um mês bom
+isoladamente pode deixar horas e blocos ruins para o seguinte. Com
+
+    parametros.feixe = B | true (B = 3) | {"largura": B, "alternativas": k}
+
+cada mês expande as B cadeias do feixe pedindo ao motor as k (padrão B)
+melhores tentativas a partir do estado final de cada uma (horas, dias e
+o ciclo de cada operador; com o ciclo herdado, k do herdado e k do
+recomeço, ver _gerar_mes_continuo); das B × k
+cadeias resultantes ficam as B de menor custo (soma dos scores mensais,
+empate pela ordem cadeia/alternativa). No fim vence a cadeia de menor
+custo e os meses dela são entregues.
+
+As B expansões de um mês rodam em paralelo num ProcessPoolExecutor
+(min(processos, B) workers, motor serial em cada um): com processos >= B
+o tempo de parede fica perto do ano guloso. O resultado não depende do
+número de processos. Os meses só saem quando o ano termina (stream e
+jobs recebem todos no fim) e o resumo ganha "feixe".
+"""
+
+FEIXE_LARGURA_PADRAO = 3
+
+
+def _opcoes_feixe(params):
+    opcoes = (params or {}).get("feixe")
+    if not opcoes:
+        return None
+    if opcoes is True:
+        opcoes = {}
+    elif not isinstance(opcoes, dict):
+        opcoes = {"largura": opcoes}
+    largura = int(opcoes.get("largura", FEIXE_LARGURA_PADRAO))
+    if largura <= 1:
+        return None
+    return {"largura": largura, "alternativas": max(1, int(opcoes.get("alternativas") or largura))}
+
+
+def _estado_da_cadeia(meses, estado_ciclo=None, continuidade=False):
+    """Estado final da cadeia: horas/dias acumulados (+ ciclo do último mês com continuidade)."""
+    if not meses:
+        return None, estado_ciclo
+    ultimo = meses[-1]
+    return ({"horas": ultimo["horas"], "dias_trab": ultimo["dias_trab"]},
+            ultimo["estado_final"] if continuidade else None)
+
+
+def _expandir_no_feixe(ano, mes, funcionarios, params, info, estados, FLEXIBILIZAR,
+                       tentativas, tempo_limite_ms, top_k):
+    """Uma cadeia do feixe → até top_k saídas do mês por partida (vencedora primeiro), com "grade"."""
+    estado, estado_ciclo = estados
+    saidas = []
+    for res in _gerar_mes_continuo(
+        ano, mes, funcionarios, params, info, estado_ciclo=estado_ciclo,
+        estado_acumulado=estado, FLEXIBILIZAR=FLEXIBILIZAR,
+        tentativas=tentativas, mes_acum_horas=estado["horas"] if estado else None,
+        processos=1, tempo_limite_ms=tempo_limite_ms, incluir_grade=True, top_k=top_k,
+    ):
+        if res is not None:
+            saidas += [res] + res.pop("alternativas", [])
+    return saidas
+
+
+def _melhor_cadeia_feixe(ano, mes_inicio, funcionarios, params, info, opcoes,
+                         FLEXIBILIZAR, tentativas, processos, prazo, estado_ciclo=None):
+    """Busca em feixe do mês inicial a dezembro → (saídas dos meses, resumo do feixe)."""
+    largura, k = opcoes["largura"], opcoes["alternativas"]
+    processos = min(_resolver_processos(processos), largura)
+    pool = ProcessPoolExecutor(max_workers=processos) if processos > 1 else None
+    feixe = [(0.0, ())]   # (custo acumulado, saídas dos meses da cadeia)
+    avaliadas = 0
+    try:
+        for m in range(int(mes_inicio), 13):
+            print(f"\033[94mGerando escala para {ano}-{parse_mes(m)} (feixe {len(feixe)})\033[0m")
+            limite_no = None
+            if prazo is not None:
+                # orçamento do mês dividido pelas "ondas" de expansões que o pool roda
+                ondas = -(-len(feixe) // processos)
+                limite_no = max(0.0, (prazo - time.time()) * 1000 / (13 - m) / ondas)
+            args = [(ano, m, funcionarios, params, info,
+                     _estado_da_cadeia(meses, estado_ciclo, _continuidade_ciclo(params)), FLEXIBILIZAR,
+                     tentativas, limite_no, k) for _, meses in feixe]
+            with medir(f"feixe:{ano}-{parse_mes(m)}"):
+                if pool is None:
+                    expansoes = [_expandir_no_feixe(*a) for a in args]
+                else:
+                    expansoes = [f.result() for f in [pool.submit(_expandir_no_feixe, *a) for a in args]]
+
+            candidatos = [
+                (custo + alt["score"], (i, j), meses + (alt,))
+                for i, ((custo, meses), alts) in enumerate(zip(feixe, expansoes))
+                for j, alt in enumerate(alts)
+            ]
+            avaliadas += len(candidatos)
+            candidatos.sort(key=lambda c: (c[0], c[1]))
+            feixe = [(custo, meses) for custo, _, meses in candidatos[:largura]]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    custo, meses = feixe[0]
+    return list(meses), {
+        "largura": largura,
+        "alternativas": k,
+        "custo": round(custo, 4),
+        "cadeias_avaliadas": avaliadas,
+    }
+
+
+def gerar_escala_ano_iter(ano, mes_inicio, funcionarios, params, info,
+                          FLEXIBILIZAR=True, tentativas=50, processos=1, tempo_limite_ms=None,
+                          estado_ciclo=None, incluir_grade=False):
+    """
+    Gera do mês inicial até dezembro, entregando cada mês assim que fica
+    pronto: produz ("mes", "AAAA-MM", resultado_do_mes) e, no fim,
+    ("resumo", None, resumo_anual).
+
+    Com `tempo_limite_ms` o orçamento é do ano inteiro: cada mês recebe
+    (tempo restante / meses restantes), então o que um mês não gasta fica
+    para os seguintes. `resumo_anual` é calculado das grades compactas do
+    motor (sem reler o JSON de cada mês).
+
+    Cada mês parte do ciclo em que o anterior terminou (estado_final →
+    estado_ciclo), disputando com o recomeço do ciclo (_gerar_mes_continuo);
+    o mês diz qual ficou em "ciclo_herdado". Com
+    parametros.continuidade_ciclo = false o ciclo recomeça a cada mês, como
+    antes. `estado_ciclo` opcional vale para o mês inicial.
+
+    Com parametros.feixe o ano sai da busca em feixe (_melhor_cadeia_feixe).
+    `incluir_grade` deixa a EscalaArray de cada mês em "grade" (uso interno).
+    """
+    prazo = time.time() + float(tempo_limite_ms) / 1000 if tempo_limite_ms is not None else None
+    grades = []
+    estado = None
+    validos = [f for f in funcionarios if f.get("perfil") in ("EXP", "AUX")]
+    if info.get("disponibilidade") is None:
+        # compila férias/restrições uma vez para todos os meses restantes
+        info = {**info, "disponibilidade": compilar_disponibilidade(
+            validos, info, datetime(ano, int(mes_inicio), 1).date(), datetime(ano, 12, 31).date())}
+
+    opcoes_feixe = _opcoes_feixe(params)
+    if opcoes_feixe:
+        meses, resumo_feixe = _melhor_cadeia_feixe(ano, mes_inicio, funcionarios, params, info, opcoes_feixe,
+                                                   FLEXIBILIZAR, tentativas, processos, prazo, estado_ciclo)
+        for m, res in enumerate(meses, start=int(mes_inicio)):
+            grades.append(res["grade"] if incluir_grade else res.pop("grade"))
+            yield "mes", f"{ano}-{parse_mes(m)}", res
+        yield "resumo", None, {**resumo_anual(EscalaArray.concatenar(grades)), "feixe": resumo_feixe}
+        return
+
+    for m in range(int(mes_inicio), 13):
+        print(f"\033[94mGerando escala para {ano}-{parse_mes(m)}\033[0m")
+        limite_mes = None
+        if prazo is not None:
+            limite_mes = max(0.0, (prazo - time.time()) * 1000 / (13 - m))
+        res, recomeco = _gerar_mes_continuo(
+            ano, m, funcionarios, params, info, estado_ciclo=estado_ciclo,
+            estado_acumulado=estado, FLEXIBILIZAR=FLEXIBILIZAR,
+            tentativas=tentativas, mes_acum_horas=estado["horas"] if estado else None,
+            processos=processos, tempo_limite_ms=limite_mes, incluir_grade=True,
+        )
+        if recomeco is not None:
+            res["ciclo_herdado"] = res["score"] <= recomeco["score"]
+            if not res["ciclo_herdado"]:
+                res = {**recomeco, "ciclo_herdado": False}
+        grades.append(res["grade"] if incluir_grade else res.pop("grade"))
+        estado = {"horas": res["horas"], "dias_trab": res["dias_trab"]}
+        estado_ciclo = res["estado_final"] if _continuidade_ciclo(params) else None
+        yield "mes", f"{ano}-{parse_mes(m)}", res
+    yield "resumo", None, resumo_anual(EscalaArray.concatenar(grades))
+
+
+def gerar_escala_ano(ano, mes_inicio, funcionarios, params, info,
+                     FLEXIBILIZAR=True, tentativas=50, processos=1, tempo_limite_ms=None,
+                     ao_concluir_mes=None, estado_ciclo=None, incluir_grade=False):
+    """
+    Ano inteiro de uma vez (ver gerar_escala_ano_iter).
+    `ao_concluir_mes(chave, res_mes)` é chamado a cada mês pronto.
+    """
+    resultados, resumo = {}, None
+    for tipo, chave, res in gerar_escala_ano_iter(
+            ano, mes_inicio, funcionarios, params, info, FLEXIBILIZAR=FLEXIBILIZAR,
+            tentativas=tentativas, processos=processos, tempo_limite_ms=tempo_limite_ms,
+            estado_ciclo=estado_ciclo, incluir_grade=incluir_grade):
+        if tipo == "mes":
+            resultados[chave] = res
+            if ao_concluir_mes:
+                ao_concluir_mes(chave, res)
+        else:
+            resumo = res
+    return {
+        "ano": ano,
+        "mes_inicio": parse_mes(mes_inicio),
+        "escala": resultados,
+        "resumo_anual": resumo,
+    }
+
+
+# ========================
+# STREAMING (NDJSON / SSE) PARA O ANO
+# ========================
+"""
+parametros.stream = "ndjson" | "sse" (ou Accept: application/x-ndjson /
+text/event-stream) faz o tipo "ano" responder mês a mês em vez de esperar
+o ano todo. Um registro JSON compacto por linha (NDJSON) ou por evento
+(SSE, `event: mes|resumo|erro`):
+
+    {"tipo": "mes", "chave": "2026-01", "dias": [...], "parecer": [...], "score": ..., ...}
+    ...
+    {"tipo": "resumo", "ano": 2026, "mes_inicio": "01", "meses": [...], "resumo_anual": {...}}
+
+Depois que o primeiro byte sai o status já é 200, então falhas no meio
+viram um registro {"tipo": "erro", ...}. Streaming não passa pelo cache.
+"""
+
+TIPOS_STREAM = {
+    "ndjson": "application/x-ndjson",
+    "sse":    "text/event-stream",
+}
+
+
+def modo_stream(request, params):
+    modo = params.get("stream")
+    if modo in TIPOS_STREAM:
+        return modo
+    aceita = (getattr(request, "headers", None) or {}).get("Accept", "") or ""
+    for modo, mime in TIPOS_STREAM.items():
+        if mime in aceita:
+            return modo
+    return None
+
+
+def _registro_stream(modo, obj):
+    linha = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    if modo == "sse":
+        return f"event: {obj['tipo']}\ndata: {linha}\n\n"
+    return linha + "\n"
+
+
+def stream_escala_ano(modo, ano, mes_inicio, funcionarios, params, info, **kw):
+    """Gerador de registros (str) para o corpo da resposta."""
+    meses = []
+    try:
+        for tipo, chave, res in gerar_escala_ano_iter(ano, mes_inicio, funcionarios, params, info, **kw):
+            if tipo == "mes":
+                meses.append(chave)
+                yield _registro_stream(modo, {"tipo": "mes", "chave": chave, **res})
+            else:
+                yield _registro_stream(modo, {
+                    "tipo": "resumo",
+                    "ano": ano,
+                    "mes_inicio": parse_mes(mes_inicio),
+                    "meses": meses,
+                    "resumo_anual": res,
+                })
+    except Exception as e:
+        print("\033[91m[ERRO]\033[0m", e)
+        yield _registro_stream(modo, {"tipo": "erro", "erro": "Falha inesperada", "detalhe": str(e)})
+
+
+# ========================
+# FORMATO COMPACTO DE SAÍDA
+# ========================
+"""
+parametros.formato = "compacto" troca, em cada mês, a lista `dias` (nomes
+repetidos por turno) por uma matriz inteira dia × turno × vaga com índices
+numa tabela única de operadores, -1 nas vagas vazias; o JSON sai sem
+indentação. Com Accept-Encoding: gzip (ou parametros.gzip) o corpo vai
+comprimido. O formato verboso continua o padrão.
+
+    {"formato": "compacto", "versao": 1, "turnos": ["00H", ...],
+     "operadores": [{"id": 1, "nome": "..."}, ...],
+     ... mês: {"periodo": "2026-01", "grade": [[[0, 5], [2, 7], ...], ...], "horas": ..., ...}
+     ... ano: {"escala": {"2026-01": {mês compacto}, ...}, ...}}
+
+A matriz é a própria EscalaArray do motor (res["grade"], pedida com
+incluir_grade em gerar_do_payload), com os mesmos índices de
+`funcionarios` válidos: nada volta por nomes. Uma resposta verbosa sem
+"grade" ainda é aceita, resolvendo os nomes (nomes repetidos caem no
+primeiro operador com o nome).
+
+descompactar_escala devolve exatamente o formato verboso. O streaming
+(parametros.stream) continua verboso.
+"""
+
+FORMATO_COMPACTO_VERSAO = 1
+
+
+def _compactar_mes(res, operadores, periodo):
+    escala = res.get("grade")
+    if not isinstance(escala, EscalaArray):
+        escala = EscalaArray.from_json(res["dias"], operadores)
+    out = {k: v for k, v in res.items() if k not in ("dias", "grade")}
+    return {"periodo": periodo, "grade": escala.dados.tolist(), **out}
+
+
+def _descompactar_mes(res, operadores):
+    ano, mes = (int(x) for x in res["periodo"].split("-"))
+    grade = res["grade"]
+    dados = np.array(grade, dtype=np.int16).reshape(len(grade), len(TURNOS), -1)
+    escala = EscalaArray(dados, operadores, [str_data(ano, mes, d) for d in range(1, len(grade) + 1)])
+    out = {k: v for k, v in res.items() if k not in ("periodo", "grade")}
+    return {"dias": escala.to_json(), **out}
+
+
+def compactar_escala(res, funcionarios, ano, mes_inicio):
+    """
+    Resposta (mês ou ano) → formato compacto. `funcionarios` são os válidos
+    na ordem do motor; com "grade" (EscalaArray) em cada mês ela é usada direto.
+    """
+    operadores = [{"id": f["id"], "nome": f.get("nome")} for f in funcionarios]
+    base = {"formato": "compacto", "versao": FORMATO_COMPACTO_VERSAO,
+            "turnos": TURNOS, "operadores": operadores}
+    if "escala" not in res:
+        return {**base, **_compactar_mes(res, operadores, f"{ano}-{parse_mes(mes_inicio)}")}
+    escala = {chave: _compactar_mes(mes, operadores, chave) for chave, mes in res["escala"].items()}
+    return {**base, **res, "escala": escala}
+
+
+def descompactar_escala(obj):
+    """Formato compacto → resposta verbosa original (mês ou ano)."""
+    if obj.get("formato") != "compacto":
+        return obj
+    operadores = obj["operadores"]
+    resto = {k: v for k, v in obj.items() if k not in ("formato", "versao", "turnos", "operadores")}
+    if "escala" not in resto:
+        return _descompactar_mes(resto, operadores)
+    return {**resto, "escala": {chave: _descompactar_mes(mes, operadores)
+                                for chave, mes in resto["escala"].items()}}
+
+
+# ========================
+# CACHE DE RESULTADOS (endereçado por conteúdo)
+# ========================
+"""
+Reenviar o mesmo payload com a mesma seed dá exatamente a mesma escala,
+então a resposta é guardada pela chave
+
+    sha256(payload normalizado (JSON com chaves ordenadas) + versão do código)
+
+em dois níveis: LRU em memória (por instância) e SQLite em disco
+(ESCALA_CACHE_DIR, padrão /tmp/escala_cache, sobrevive entre requisições
+da mesma máquina). Um acerto devolve o JSON guardado sem chamar o motor.
+
+Só entram payloads reproduzíveis: com parametros.seed e sem
+tempo_limite_ms (o resultado por prazo depende da máquina).
+parametros.cache = false desliga. Ajustes por ambiente:
+    ESCALA_CACHE_MEM_ITENS  (32)    itens no LRU em memória
+    ESCALA_CACHE_MAX_MB     (256)   tamanho máximo do SQLite
+    ESCALA_CACHE_TTL_S      (7 dias) validade de uma entrada
+Cabeçalhos: X-Cache (HIT-MEMORIA | HIT-DISCO | MISS | BYPASS), X-Cache-Key,
+X-Cache-Hits e X-Cache-Misses (contadores da instância).
+"""
+
+
+# só mudam a forma de entrega, não a escala: ficam fora da chave
+PARAMETROS_TRANSPORTE = ("cache", "stream", "assincrono", "metricas",
+                         "profile", "profile_top", "profile_intervalo_ms")
+
+
+def _versao_codigo():
+    """Hash deste arquivo: mudou o motor, mudam as chaves."""
+    try:
+        with open(__file__, "rb") as fh:
+            return hashlib.sha256(fh.read()).hexdigest()[:16]
+    except OSError:
+        return "desconhecida"
+
+
+class CacheResultados:
+    def __init__(self, diretorio=None, itens_memoria=None, max_mb=None, ttl_s=None):
+        self.diretorio = diretorio or os.environ.get("ESCALA_CACHE_DIR", "/tmp/escala_cache")
+        self.itens_memoria = int(itens_memoria or os.environ.get("ESCALA_CACHE_MEM_ITENS", 32))
+        self.max_bytes = int(float(max_mb or os.environ.get("ESCALA_CACHE_MAX_MB", 256)) * 1024 * 1024)
+        self.ttl_s = float(ttl_s or os.environ.get("ESCALA_CACHE_TTL_S", 7 * 24 * 3600))
+        self.versao = _versao_codigo()
+        self.memoria = OrderedDict()   # chave -> (criado, corpo)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = None
+
+    # ---- chave ----
+    def chave(self, payload):
+        params = {k: v for k, v in (payload.get("parametros") or {}).items()
+                  if k not in PARAMETROS_TRANSPORTE}
+        normalizado = json.dumps({**payload, "parametros": params},
+                                 sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(f"{self.versao}|{normalizado}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def cacheavel(payload):
+        params = payload.get("parametros") or {}
+        return (params.get("cache", True) is not False and params.get("seed") is not None
+                and params.get("tempo_limite_ms") is None)
+
+    # ---- disco ----
+    def _conexao(self):
+        if self._db is None:
+            os.makedirs(self.diretorio, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(self.diretorio, "cache.sqlite"),
+                                       check_same_thread=False, timeout=5)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS resultados ("
+                " chave TEXT PRIMARY KEY, corpo TEXT NOT NULL,"
+                " criado REAL NOT NULL, acessado REAL NOT NULL, tamanho INTEGER NOT NULL)")
+            self._db.commit()
+        return self._db
+
+    def _disco_ler(self, chave, agora):
+        db = self._conexao()
+        linha = db.execute("SELECT corpo, criado FROM resultados WHERE chave = ?", (chave,)).fetchone()
+        if linha is None:
+            return None
+        if agora - linha[1] > self.ttl_s:
+            db.execute("DELETE FROM resultados WHERE chave = ?", (chave,))
+            db.commit()
+            return None
+        db.execute("UPDATE resultados SET acessado = ? WHERE chave = ?", (agora, chave))
+        db.commit()
+        return linha[1], linha[0]
+
+    def _disco_gravar(self, chave, corpo, agora):
+        db = self._conexao()
+        db.execute("INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?, ?)",
+                   (chave, corpo, agora, agora, len(corpo.encode("utf-8"))))
+        db.execute("DELETE FROM resultados WHERE criado < ?", (agora - self.ttl_s,))
+        # tamanho: remove os acessados há mais tempo até caber
+        total = db.execute("SELECT COALESCE(SUM(tamanho), 0) FROM resultados").fetchone()[0]
+        if total > self.max_bytes:
+            for velha, tamanho in db.execute(
+                    "SELECT chave, tamanho FROM resultados ORDER BY acessado").fetchall():
+                if total <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM resultados WHERE chave = ?", (velha,))
+                total -= tamanho
+        db.commit()
+
+    # ---- API ----
+    def obter(self, chave):
+        """(corpo, nível) ou (None, None); conta hit/miss."""
+        agora = time.time()
+        with self._lock:
+            item = self.memoria.get(chave)
+            if item is not None and agora - item[0] <= self.ttl_s:
+                self.memoria.move_to_end(chave)
+                self.hits += 1
+                return item[1], "HIT-MEMORIA"
+            self.memoria.pop(chave, None)
+            try:
+                item = self._disco_ler(chave, agora)
+            except sqlite3.Error as e:
+                print("\033[93m[CACHE]\033[0m disco indisponível:", e)
+                item = None
+            if item is None:
+                self.misses += 1
+                return None, None
+            self._memoria_gravar(chave, item)
+            self.hits += 1
+            return item[1], "HIT-DISCO"
+
+    def gravar(self, chave, corpo):
+        agora = time.time()
+        with self._lock:
+            self._memoria_gravar(chave, (agora, corpo))
+            try:
+                self._disco_gravar(chave, corpo, agora)
+            except sqlite3.Error as e:
+                print("\033[93m[CACHE]\033[0m disco indisponível:", e)
+
+    def _memoria_gravar(self, chave, item):
+        self.memoria[chave] = item
+        self.memoria.move_to_end(chave)
+        while len(self.memoria) > self.itens_memoria:
+            self.memoria.popitem(last=False)
+
+    def cabecalhos(self, estado, chave=None):
+        return {
+            "X-Cache": estado,
+            **({"X-Cache-Key": chave[:16]} if chave else {}),
+            "X-Cache-Hits": str(self.hits),
+            "X-Cache-Misses": str(self.misses),
+        }
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def _cache():
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = CacheResultados()
+    return _CACHE
+
+
+# ========================
+# JOBS ASSÍNCRONOS (submeter / consultar / resultado)
+# ========================
+"""
+Para execuções longas a chamada não precisa ficar presa até o fim:
+
+    POST  {..., "parametros": {..., "assincrono": true}}
+          → 202 {"job_id": ..., "status": "pendente"}
+    GET   ?job=<id>              → status + progresso
+    GET   ?job=<id>&resultado=1  → JSON da escala (409 enquanto não terminou)
+
+O job roda numa thread da própria instância (deploy com --max-instances=1;
+no Cloud Run/Functions a CPU precisa ficar alocada fora da requisição).
+Estado e resultado ficam em SQLite (ESCALA_JOBS_DIR, padrão
+/tmp/escala_jobs). Se o processo reinicia, jobs que estavam pendentes ou
+executando voltam para a fila a partir do payload guardado.
+
+Jobs terminados (concluido / erro) expiram como o cache: passados
+ESCALA_JOBS_TTL_S (padrão 1 dia) desde a última atualização são apagados
+ao abrir a fila, a cada submissão e ao serem consultados (404). O /tmp
+das Cloud Functions ocupa memória da instância.
+
+Progresso:
+    meses_concluidos / meses_total, ultimo_mes, mes_atual, score do último
+    mês e melhor_score entre os meses (a cada mês concluído);
+    tentativas (somadas), tentativas_mes e melhor_score_mes do mês em
+    andamento, atualizados de dentro do laço de tentativas do motor
+    (avisar_tentativas), gravados no máximo a cada PROGRESSO_INTERVALO_S.
+"""
+
+STATUS_JOB_ATIVOS = ("pendente", "executando")
+STATUS_JOB_FINAIS = ("concluido", "erro")
+PROGRESSO_INTERVALO_S = 0.5
+
+_PROGRESSO_LOCAL = threading.local()
+
+
+@contextmanager
+def acompanhar_tentativas(fn):
+    """Liga `fn(n_tentativas, melhor_score_ou_None)` para o motor nesta thread."""
+    anterior = getattr(_PROGRESSO_LOCAL, "fn", None)
+    _PROGRESSO_LOCAL.fn = fn
+    try:
+        yield
+    finally:
+        _PROGRESSO_LOCAL.fn = anterior
+
+
+def avisar_tentativas(n, melhor=None):
+    fn = getattr(_PROGRESSO_LOCAL, "fn", None)
+    if fn is not None:
+        fn(n, melhor)
+
+
+class FilaJobs:
+    def __init__(self, diretorio=None, ttl_s=None):
+        self.diretorio = diretorio or os.environ.get("ESCALA_JOBS_DIR", "/tmp/escala_jobs")
+        self.ttl_s = float(ttl_s or os.environ.get("ESCALA_JOBS_TTL_S", 24 * 3600))
+        os.makedirs(self.diretorio, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.diretorio, "jobs.sqlite"),
+                                   check_same_thread=False, timeout=5)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL,"
+                " progresso TEXT NOT NULL, resultado TEXT, erro TEXT,"
+                " criado REAL NOT NULL, atualizado REAL NOT NULL)")
+            self._expirar(time.time())
+            pendentes = [linha[0] for linha in self._db.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY criado", STATUS_JOB_ATIVOS)]
+        for job_id in pendentes:
+            print(f"\033[93m[JOB]\033[0m retomando {job_id}")
+            self._iniciar(job_id)
+
+    def _expirar(self, agora):
+        """Apaga os jobs terminados há mais de ttl_s (chamar com o lock)."""
+        self._db.execute("DELETE FROM jobs WHERE status IN (?, ?) AND atualizado < ?",
+                         (*STATUS_JOB_FINAIS, agora - self.ttl_s))
+        self._db.commit()
+
+    def _atualizar(self, job_id, **campos):
+        campos["atualizado"] = time.time()
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in campos)} WHERE id = ?",
+                (*campos.values(), job_id))
+            self._db.commit()
+
+    def submeter(self, payload):
+        job_id = hashlib.sha256(os.urandom(16)).hexdigest()[:20]
+        ano = int(payload["ano"])
+        mes_inicio = int(payload["mes_inicio"])
+        total = 1 if payload.get("tipo", "ano") == "mes" else 13 - mes_inicio
+        progresso = {
+            "meses_concluidos": 0,
+            "meses_total": total,
+            "ultimo_mes": None,
+            "mes_atual": f"{ano}-{parse_mes(mes_inicio)}",
+            "tentativas": 0,
+            "tentativas_mes": 0,
+            "melhor_score_mes": None,
+            "score": None,
+            "melhor_score": None,
+        }
+        agora = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs VALUES (?, 'pendente', ?, ?, NULL, NULL, ?, ?)",
+                (job_id, json.dumps(payload, ensure_ascii=False), json.dumps(progresso), agora, agora))
+            self._expirar(agora)
+        self._iniciar(job_id)
+        return {"job_id": job_id, "status": "pendente", "progresso": progresso}
+
+    def _iniciar(self, job_id):
+        threading.Thread(target=self._executar, args=(job_id,), daemon=True,
+                         name=f"job-{job_id}").start()
+
+    def _executar(self, job_id):
+        with self._lock:
+            payload, progresso = self._db.execute(
+                "SELECT payload, progresso FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        payload, progresso = json.loads(payload), json.loads(progresso)
+        progresso.update(meses_concluidos=0, tentativas=0, tentativas_mes=0, melhor_score_mes=None,
+                         score=None, melhor_score=None)
+        self._atualizar(job_id, status="executando", progresso=json.dumps(progresso))
+        gravado = [time.time()]
+
+        def ao_tentar(n, melhor):
+            progresso["tentativas"] += n
+            progresso["tentativas_mes"] += n
+            if melhor is not None and (progresso["melhor_score_mes"] is None
+                                       or melhor < progresso["melhor_score_mes"]):
+                progresso["melhor_score_mes"] = melhor
+            if time.time() - gravado[0] >= PROGRESSO_INTERVALO_S:
+                gravado[0] = time.time()
+                self._atualizar(job_id, progresso=json.dumps(progresso))
+
+        def ao_concluir_mes(chave, res):
+            ano, mes = (int(x) for x in chave.split("-"))
+            progresso["meses_concluidos"] += 1
+            progresso["ultimo_mes"] = chave
+            progresso["mes_atual"] = f"{ano}-{parse_mes(mes + 1)}" if mes < 12 \
+                and progresso["meses_concluidos"] < progresso["meses_total"] else None
+            progresso.update(tentativas_mes=0, melhor_score_mes=None, score=res["score"])
+            if progresso["melhor_score"] is None or res["score"] < progresso["melhor_score"]:
+                progresso["melhor_score"] = res["score"]
+            self._atualizar(job_id, progresso=json.dumps(progresso))
+
+        try:
+            with acompanhar_tentativas(ao_tentar):
+                resposta = gerar_do_payload(payload, ao_concluir_mes=ao_concluir_mes)
+            corpo = _json(resposta, compacto=_formato_compacto(payload))[0]
+        except Exception as e:
+            print("\033[91m[JOB]\033[0m", job_id, e)
+            self._atualizar(job_id, status="erro", erro=str(e))
+            return
+        cache = _cache()
+        if cache.cacheavel(payload):
+            cache.gravar(cache.chave(payload), corpo)
+        self._atualizar(job_id, status="concluido", resultado=corpo)
+
+    def consultar(self, job_id, com_resultado=False):
+        agora = time.time()
+        with self._lock:
+            linha = self._db.execute(
+                "SELECT status, progresso, erro, criado, atualizado, resultado FROM jobs WHERE id = ?",
+                (job_id,)).fetchone()
+            if linha is not None and linha[0] in STATUS_JOB_FINAIS and agora - linha[4] > self.ttl_s:
+                self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                self._db.commit()
+                linha = None
+        if linha is None:
+            return None
+        status, progresso, erro, criado, atualizado, resultado = linha
+        out = {
+            "job_id": job_id,
+            "status": status,
+            "progresso": json.loads(progresso),
+            "criado": datetime.fromtimestamp(criado).isoformat(timespec="seconds"),
+            "atualizado": datetime.fromtimestamp(atualizado).isoformat(timespec="seconds"),
+            **({"erro": erro} if erro else {}),
+        }
+        if com_resultado:
+            out["resultado"] = resultado
+        return out
+
+
+_JOBS = None
+_JOBS_LOCK = threading.Lock()
+
+
+def _jobs():
+    # FilaJobs() retoma os jobs pendentes: duas filas rodariam o mesmo job duas vezes
+    global _JOBS
+    if _JOBS is None:
+        with _JOBS_LOCK:
+            if _JOBS is None:
+                _JOBS = FilaJobs()
+    return _JOBS
+
+
+def responder_job(job_id, resultado=False):
+    job = _jobs().consultar(job_id, com_resultado=resultado)
+    if job is None:
+        return _json({"erro": "Job não encontrado", "job_id": job_id}, status=404)
+    if not resultado:
+        return _json(job)
+    if job["status"] != "concluido":
+        job.pop("resultado", None)
+        return _json(job, status=409)
+    return (job["resultado"], 200, {"Content-Type": "application/json", **_cors_headers()})
+
+
+# ========================
+# MÉTRICAS POR FASE (parametros.metricas)
+# ========================
+"""
+Instrumentação opt-in: com parametros.metricas = true (ou ?metricas=1;
+?metricas=0 desliga) a resposta ganha um objeto "_metrics" e o log uma
+linha JSON estruturada:
+
+  • fases      → wall_ms / cpu_ms / chamadas de: payload (leitura do JSON),
+                 parse_ferias / parse_preferencias / parse_restricoes,
+                 preparar_estado_continuo, motor:AAAA-MM, parecer:AAAA-MM
+                 e serializacao
+  • contadores → tentativas rodadas / podadas / mantidas, vagas preenchidas
+                 pelo fallback FLEXIBILIZAR e extensões elásticas de bloco,
+                 somados sobre todas as tentativas de todos os meses
+
+cpu_ms é o CPU da thread que atende o pedido (time.thread_time): com
+processos > 1 o trabalho dos workers só aparece no wall_ms do motor.
+Desligado, medir() é um contexto nulo e contar() retorna na hora.
+Só no caminho síncrono (stream e jobs ignoram) e sem cache: o objetivo
+é medir uma geração de verdade.
+"""
+
+_METRICAS_LOCAL = threading.local()
+
+
+class Metricas:
+    def __init__(self, inicio=None):
+        self.inicio = inicio or (time.perf_counter(), time.thread_time())
+        self.fases = {}
+        self.contadores = Counter()
+
+    def registrar(self, nome, wall_s, cpu_s):
+        fase = self.fases.setdefault(nome, {"wall_ms": 0.0, "cpu_ms": 0.0, "chamadas": 0})
+        fase["wall_ms"] += wall_s * 1000
+        fase["cpu_ms"] += cpu_s * 1000
+        fase["chamadas"] += 1
+
+    @contextmanager
+    def fase(self, nome):
+        w0, c0 = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.registrar(nome, time.perf_counter() - w0, time.thread_time() - c0)
+
+    def relatorio(self):
+        w0, c0 = self.inicio
+        arredondar = lambda f: {k: round(v, 3) if isinstance(v, float) else v for k, v in f.items()}
+        return {
+            "total": arredondar({"wall_ms": (time.perf_counter() - w0) * 1000,
+                                 "cpu_ms": (time.thread_time() - c0) * 1000}),
+            "fases": {nome: arredondar(f) for nome, f in self.fases.items()},
+            "contadores": dict(self.contadores),
+        }
+
+
+def metricas_ativas():
+    return getattr(_METRICAS_LOCAL, "atual", None)
+
+
+def medir(nome):
+    m = metricas_ativas()
+    return m.fase(nome) if m is not None else nullcontext()
+
+
+def contar(**contadores):
+    m = metricas_ativas()
+    if m is not None:
+        m.contadores.update(contadores)
+
+
+def _metricas_pedidas(request, payload):
+    args = getattr(request, "args", None) or {}
+    params = payload.get("parametros") or {}
+    return _flag_ligada(args.get("metricas", params.get("metricas")))
+
+
+def _anexar_json(corpo, chave, obj, compacto=False):
+    """Acrescenta `chave: obj` ao objeto JSON já serializado por _json (sem re-serializar)."""
+    if compacto:
+        valor = json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+        return f"{corpo[:-1]},{json.dumps(chave)}:{valor}}}"
+    valor = json.dumps(obj, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+    return f"{corpo[:-2]},\n  {json.dumps(chave)}: {valor}\n}}"
+
+
+def gerar_com_metricas(payload, metricas):
+    """Gera + serializa sob `metricas`; devolve a resposta de _json com "_metrics" anexado."""
+    compacto = _formato_compacto(payload)
+    _METRICAS_LOCAL.atual = metricas
+    try:
+        res = gerar_do_payload(payload)
+        with metricas.fase("serializacao"):
+            corpo, status, headers = _json(res, compacto=compacto)
+    finally:
+        _METRICAS_LOCAL.atual = None
+
+    relatorio = metricas.relatorio()
+    print(json.dumps({"severity": "INFO", "message": "metricas", "tipo": payload.get("tipo", "ano"),
+                      "ano": payload.get("ano"), "mes_inicio": payload.get("mes_inicio"),
+                      "_metrics": relatorio}, ensure_ascii=False, separators=(",", ":")))
+    return _anexar_json(corpo, "_metrics", relatorio, compacto), status, headers
+
+
+# ========================
+# PROFILING (?profile=1)
+# ========================
+"""
+Com ?profile=1 (ou parametros.profile = true) a geração roda sob dois
+perfiladores ao mesmo tempo e a resposta ganha um objeto "_profile":
+
+  • cProfile (determinístico) → "top": as `profile_top` funções (padrão
+    30) com mais tempo próprio, com chamadas, tottime_ms e cumtime_ms
+  • amostragem → uma thread lê sys._current_frames() da thread do pedido a
+    cada `profile_intervalo_ms` (padrão 5) e conta as pilhas; "collapsed"
+    sai no formato "a;b;c N" (flamegraph.pl, speedscope, inferno)
+
+Se ESCALA_PROFILE_DIR estiver definido, o .pstats e o .collapsed também
+são gravados lá e os caminhos vêm em "arquivos".
+
+Só a thread do pedido é perfilada: com processos > 1 o tempo dos workers
+aparece como espera no pool. Desligado, nada disso é importado no caminho
+do pedido além de opcoes_profile(), então o custo é zero. Como métricas,
+ignora cache, stream e jobs.
+"""
+
+PROFILE_TOP_PADRAO = 30
+PROFILE_INTERVALO_MS_PADRAO = 5
+
+
+def opcoes_profile(request, payload):
+    """kwargs de perfilar() se o pedido quer profiling, senão None."""
+    args = getattr(request, "args", None) or {}
+    params = payload.get("parametros") or {}
+    if not _flag_ligada(args.get("profile", params.get("profile"))):
+        return None
+    return {
+        "top": int(args.get("profile_top", params.get("profile_top", PROFILE_TOP_PADRAO))),
+        "intervalo_ms": float(args.get("profile_intervalo_ms",
+                                       params.get("profile_intervalo_ms", PROFILE_INTERVALO_MS_PADRAO))),
+    }
+
+
+def _pilha_colapsada(frame):
+    nomes = []
+    while frame is not None:
+        codigo = frame.f_code
+        nomes.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(nomes))
+
+
+def _amostrar_pilhas(alvo, intervalo_s, parar, pilhas):
+    while not parar.wait(intervalo_s):
+        frame = sys._current_frames().get(alvo)
+        if frame is not None:
+            pilhas[_pilha_colapsada(frame)] += 1
+
+
+def perfilar(fn, top=PROFILE_TOP_PADRAO, intervalo_ms=PROFILE_INTERVALO_MS_PADRAO):
+    """Roda fn() sob cProfile + amostragem de pilhas; devolve (resultado, relatório)."""
+    pilhas, parar = Counter(), threading.Event()
+    amostrador = threading.Thread(
+        target=_amostrar_pilhas, args=(threading.get_ident(), intervalo_ms / 1000, parar, pilhas),
+        name="escala-profile", daemon=True)
+    perfil = cProfile.Profile()
+    w0 = time.perf_counter()
+    amostrador.start()
+    perfil.enable()
+    try:
+        resultado = fn()
+    finally:
+        perfil.disable()
+        parar.set()
+        amostrador.join()
+    wall_ms = (time.perf_counter() - w0) * 1000
+
+    stats = pstats.Stats(perfil)
+    funcoes = sorted(stats.stats.items(), key=lambda kv: kv[1][2], reverse=True)[:top]
+    collapsed = "\n".join(f"{pilha} {n}" for pilha, n in pilhas.most_common())
+    relatorio = {
+        "wall_ms": round(wall_ms, 3),
+        "top": [
+            {
+                "funcao": f"{os.path.basename(arquivo)}:{linha}({nome})",
+                "chamadas": nc,
+                "tottime_ms": round(tt * 1000, 3),
+                "cumtime_ms": round(ct * 1000, 3),
+            }
+            for (arquivo, linha, nome), (_, nc, tt, ct, _) in funcoes
+        ],
+        "amostras": sum(pilhas.values()),
+        "intervalo_ms": intervalo_ms,
+        "collapsed": collapsed,
+    }
+
+    diretorio = os.environ.get("ESCALA_PROFILE_DIR")
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+        base = os.path.join(diretorio, f"escala-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{time.time_ns() % 10**6:06d}")
+        stats.dump_stats(base + ".pstats")
+        with open(base + ".collapsed", "w", encoding="utf-8") as fh:
+            fh.write(collapsed + "\n")
+        relatorio["arquivos"] = {"pstats": base + ".pstats", "collapsed": base + ".collapsed"}
+    return resultado, relatorio
+
+
+# ========================
+# HANDLER WEB / HTTP HELPERS
+# ========================
+def _cors_headers():
+    return {
+        "Access-Control-Allow-Origin":  "*",
+        "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
+        "Access-Control-Allow-Headers": "Content-Type",
+        "Access-Control-Expose-Headers": "X-Cache, X-Cache-Key, X-Cache-Hits, X-Cache-Misses",
+    }
+
+
+def _json(obj, status=200, compacto=False):
+    return (
+        json.dumps(obj, ensure_ascii=False, separators=(",", ":")) if compacto
+        else json.dumps(obj, ensure_ascii=False, indent=2),
+        status,
+        {"Content-Type": "application/json", **_cors_headers()},
+    )
+
+
+def preparar_estado_continuo(escala_mes_anterior, funcionarios):
+    """Gera estado inicial quando há escala do mês anterior."""
+    if not escala_mes_anterior or "dias" not in escala_mes_anterior:
+        return None
+
+    fids_validos = {str(f["id"]) for f in funcionarios}
+
+    consec           = {fid: 0 for fid in fids_validos}
+    ultimo_turno     = {fid: None for fid in fids_validos}
+    dias_trabalhados = {fid: 0 for fid in fids_validos}
+    pipocacoes       = {fid: 0 for fid in fids_validos}
+
+    # pessoas por nome ou {"funcionario_id"}; EscalaArray resolve os índices
+    dias = sorted(escala_mes_anterior["dias"], key=lambda d: d["data"])
+    escala = EscalaArray.from_json(dias, funcionarios)
+    fids = [str(f["id"]) for f in funcionarios]
+    trabalhou_ontem = {fid: False for fid in fids_validos}
+
+    for linha in escala.dados.tolist():
+        trabalhou_hoje = {fid: False for fid in fids_validos}
+        for turno, pessoas in zip(TURNOS, linha):
+            for i in pessoas:
+                if i < 0:
+                    continue
+                fid = fids[i]
+
+                trabalhou_hoje[fid] = True
+                dias_trabalhados[fid] += 1
+
+                if trabalhou_ontem[fid]:
+                    consec[fid] += 1
+                else:
+                    consec[fid] = 1
+
+                if ultimo_turno[fid] and ultimo_turno[fid] != turno:
+                    if consec[fid] <= 2:
+                        pipocacoes[fid] += 1
+
+                ultimo_turno[fid] = turno
+
+        for fid in fids_validos:
+            if not trabalhou_hoje[fid]:
+                if consec[fid] > 0 and consec[fid] <= 2:
+                    pipocacoes[fid] += 1
+                consec[fid] = 0
+
+        trabalhou_ontem = trabalhou_hoje
+
+    penalidade_start = {}
+    max_trab = max(dias_trabalhados.values()) or 1
+    max_pipo = max(pipocacoes.values()) or 1
+    for fid in fids_validos:
+        peso_trabalho = dias_trabalhados[fid] / max_trab
+        peso_pipoca   = pipocacoes[fid] / max_pipo
+        penalidade_start[fid] = peso_trabalho * 0.6 + peso_pipoca * 1.2
+
+    return {
+        "consec": consec,
+        "ultimo_turno": ultimo_turno,
+        "dias_trabalhados": dias_trabalhados,
+        "pipocacoes": pipocacoes,
+        "penalidade_start": penalidade_start
+    }
+
+
+def _parametros_payload(payload):
+    """Payload do POST → argumentos comuns de gerar_escala_mes/ano."""
+    params = payload.get("parametros", {})
+    funcionarios = payload["funcionarios"]
+    info = {}
+    for chave, fn in (("ferias", parse_ferias), ("preferencias", parse_preferencias),
+                      ("restricoes", parse_restricoes)):
+        with medir(fn.__name__):
+            info[chave] = fn(payload.get(chave))
+    kw = {
+        "FLEXIBILIZAR": bool(params.get("permite_dupla_exp", True) and params.get("permite_dupla_aux", True)),
+        "tentativas":   int(params.get("quantidade_escalas", 50)),
+        "processos":    params.get("processos", 1),
+        "tempo_limite_ms": params.get("tempo_limite_ms"),
+        "estado_ciclo": payload.get("estado_ciclo"),   # estado_final de uma resposta anterior
+    }
+    return int(payload["ano"]), int(payload["mes_inicio"]), funcionarios, params, info, kw
+
+
+def _flag_ligada(valor):
+    """Flag de query string / parâmetro: só 1, true ou sim ligam (?x=0 desliga)."""
+    return valor is True or str(valor).strip().lower() in ("1", "true", "sim")
+
+
+def _formato_compacto(payload):
+    return (payload.get("parametros") or {}).get("formato") == "compacto"
+
+
+def _gzip_se_pedido(request, payload, resposta):
+    """Comprime o corpo se o cliente aceita gzip e pediu (ou usa formato compacto)."""
+    corpo, status, headers = resposta
+    params = payload.get("parametros") or {}
+    aceita = "gzip" in ((getattr(request, "headers", None) or {}).get("Accept-Encoding", "") or "")
+    if not aceita or not (params.get("gzip") or _formato_compacto(payload)):
+        return resposta
+    corpo = corpo.encode("utf-8") if isinstance(corpo, str) else corpo
+    return gzip.compress(corpo), status, {**headers, "Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+
+
+def gerar_do_payload(payload, ao_concluir_mes=None):
+    """
+    Executa o payload inteiro (mês ou ano) e devolve o dict da resposta
+    (já compacto se parametros.formato = "compacto").
+    `ao_concluir_mes(chave, res_mes)` é chamado a cada mês pronto (jobs).
+    """
+    compacto = _formato_compacto(payload)
+    res = _gerar_verboso(payload, ao_concluir_mes, incluir_grade=compacto)
+    if compacto:
+        validos = [f for f in payload["funcionarios"] if f.get("perfil") in ("EXP", "AUX")]
+        res = compactar_escala(res, validos, int(payload["ano"]), int(payload["mes_inicio"]))
+    return res
+
+
+def _gerar_verboso(payload, ao_concluir_mes=None, incluir_grade=False):
+    ano, mes_inicio, funcionarios, params, info, kw = _parametros_payload(payload)
+
+    if payload.get("tipo", "ano") == "mes":
+        estado_continuo = None
         if payload.get("gerar_continua"):
-            estado_continuo = preparar_estado_continuo(
-                payload.get("escala_mes_anterior"),
-                funcionarios
-            )
+            with medir("preparar_estado_continuo"):
+                estado_continuo = preparar_estado_continuo(
+                    payload.get("escala_mes_anterior"),
+                    funcionarios
+                )
+        res = gerar_escala_mes(ano, mes_inicio, funcionarios, params, info,
+                               estado_continuo=estado_continuo, incluir_grade=incluir_grade, **kw)
+        if ao_concluir_mes:
+            ao_concluir_mes(f"{ano}-{parse_mes(mes_inicio)}", res)
+        return res
 
-        if payload.get("tipo", "ano") == "mes":
-            res = gerar_escala_mes(
-                ano, mes_inicio, funcionarios, params, info,
-                FLEXIBILIZAR=FLEX, tentativas=tentativas,
-                estado_continuo=estado_continuo,
+    return gerar_escala_ano(ano, mes_inicio, funcionarios, params, info,
+                            ao_concluir_mes=ao_concluir_mes, incluir_grade=incluir_grade, **kw)
+
+
+def main(request):
+    try:
+        if request.method == "OPTIONS":
+            return ("", 204, _cors_headers())
+        if request.method == "GET" and request.args.get("job"):
+            return responder_job(request.args["job"], _flag_ligada(request.args.get("resultado")))
+        if request.method != "POST":
+            return _json({"erro": "Use POST"}, status=405)
+
+        inicio        = (time.perf_counter(), time.thread_time())
+        payload       = request.get_json(force=True)
+        tipo          = payload.get("tipo", "ano")
+        modo          = modo_stream(request, payload.get("parametros") or {}) if tipo != "mes" else None
+
+        if (payload.get("parametros") or {}).get("assincrono"):
+            return _json(_jobs().submeter(payload), status=202)
+
+        metricas = Metricas(inicio) if not modo and _metricas_pedidas(request, payload) else None
+        perfil = opcoes_profile(request, payload) if not modo else None
+        if metricas or perfil:
+            if metricas:
+                metricas.registrar("payload", time.perf_counter() - inicio[0], time.thread_time() - inicio[1])
+                gerar = lambda: gerar_com_metricas(payload, metricas)
+            else:
+                gerar = lambda: _json(gerar_do_payload(payload), compacto=_formato_compacto(payload))
+            if perfil:
+                (corpo, status, headers), relatorio = perfilar(gerar, **perfil)
+                corpo = _anexar_json(corpo, "_profile", relatorio, _formato_compacto(payload))
+            else:
+                corpo, status, headers = gerar()
+            headers.update(_cache().cabecalhos("BYPASS"))
+            return _gzip_se_pedido(request, payload, (corpo, status, headers))
+
+        cache = _cache()
+        chave = cache.chave(payload) if cache.cacheavel(payload) and not modo else None
+        if chave:
+            corpo, nivel = cache.obter(chave)
+            if corpo is not None:
+                return _gzip_se_pedido(request, payload, (
+                    corpo, 200, {"Content-Type": "application/json", **_cors_headers(),
+                                 **cache.cabecalhos(nivel, chave)}))
+
+        if modo:
+            ano, mes_inicio, funcionarios, params, info, kw = _parametros_payload(payload)
+            return (
+                stream_escala_ano(modo, ano, mes_inicio, funcionarios, params, info, **kw),
+                200,
+                {"Content-Type": TIPOS_STREAM[modo], "Cache-Control": "no-cache",
+                 "X-Accel-Buffering": "no", **_cors_headers(), **cache.cabecalhos("BYPASS")},
             )
-            return _json(res)
 
-        res = gerar_escala_ano(
-            ano, mes_inicio, funcionarios, params, info,
-            FLEXIBILIZAR=FLEX, tentativas=tentativas,
-        )
-        return _json(res)
+        corpo, status, headers = _json(gerar_do_payload(payload), compacto=_formato_compacto(payload))
+        if chave:
+            cache.gravar(chave, corpo)
+        headers.update(cache.cabecalhos("MISS" if chave else "BYPASS", chave))
+        return _gzip_se_pedido(request, payload, (corpo, status, headers))
 
     except Exception as e:
         print("\033[91m[ERRO]\033[0m", e)
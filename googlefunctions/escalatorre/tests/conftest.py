@@ -0,0 +1,5 @@
+import os
+import sys
+
+# main.py e benchmarks/ ficam no diretório da função, fora de um pacote
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
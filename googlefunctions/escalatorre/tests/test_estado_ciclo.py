@@ -0,0 +1,74 @@
+import main as escala
+
+
+def _contexto(estado_ciclo, restricoes=()):
+    funcionarios = [{"id": i, "nome": f"OP{i:02d}", "perfil": "EXP" if i % 2 else "AUX"}
+                    for i in range(1, 9)]
+    payload = {"ano": 2026, "mes_inicio": 2, "tipo": "mes", "funcionarios": funcionarios,
+               "ferias": [], "restricoes": list(restricoes), "parametros": {}}
+    ano, mes, funcionarios, params, info, kw = escala._parametros_payload(payload)
+    return escala._preparar_contexto_motor(ano, mes, funcionarios, info, None, None, True, estado_ciclo)
+
+
+def _snapshot(turno_atual, work_left=0, off_left=0):
+    n = 8
+    return {
+        "operadores": [str(i) for i in range(1, n + 1)],
+        "turno_atual": [turno_atual] * n,
+        "work_left": [work_left] * n,
+        "off_left": [off_left] * n,
+        "off_len_atual": [2] * n,
+        "block_len": [0] * n,
+        "em_ferias": [0] * n,
+    }
+
+
+def test_operador_pronto_mantem_turno_na_virada():
+    # folga terminou no fim do mês anterior: turno_atual já é o próximo do ciclo
+    ctx = _contexto(_snapshot("12H"))
+    assert list(ctx["ciclo0"]["turno_atual"]) == [escala.IDX_TURNO["12H"]] * 8
+
+
+def test_operador_pronto_em_turno_proibido_recomeca_sem_turno():
+    ctx = _contexto(_snapshot("00H"), [{"funcionario_id": 3, "tipo": "TURNO_PROIBIDO", "turno": "00H"}])
+    turnos = list(ctx["ciclo0"]["turno_atual"])
+    assert turnos[2] == escala.SEM_TURNO
+    assert all(t == escala.IDX_TURNO["00H"] for k, t in enumerate(turnos) if k != 2)
+
+
+def test_bloco_e_folga_em_curso_continuam():
+    ctx = _contexto(_snapshot("18H", work_left=2))
+    assert list(ctx["ciclo0"]["work_left"]) == [2] * 8
+    ctx = _contexto(_snapshot("06H", off_left=1))
+    assert list(ctx["ciclo0"]["off_left"]) == [1] * 8
+
+
+def test_alocacao_na_folga_encerra_a_folga():
+    # otimização local pode pôr alguém na folga: o bloco começa e a folga acaba
+    ctx = _contexto(_snapshot("06H", off_left=2))
+    ciclo, _ = escala._ciclo_final(ctx, [[[], [0], [], []]])
+    assert ciclo["off_left"][0] == 0
+    assert ciclo["work_left"][0] == 3
+    assert list(ciclo["off_left"][1:]) == [1] * 7
+
+
+def test_ano_mantem_ciclo_herdado_ou_recomeco(monkeypatch):
+    chamadas = []
+    original = escala.gerar_escala_mes
+
+    def espiao(*args, **kw):
+        chamadas.append((kw["tentativas"], kw.get("estado_ciclo") is not None))
+        return original(*args, **kw)
+
+    monkeypatch.setattr(escala, "gerar_escala_mes", espiao)
+    funcionarios = [{"id": i, "nome": f"OP{i:02d}", "perfil": "EXP" if i % 2 else "AUX"} for i in range(1, 11)]
+    payload = {"ano": 2026, "mes_inicio": 11, "tipo": "ano", "funcionarios": funcionarios,
+               "ferias": [], "restricoes": [], "parametros": {"seed": 1}}
+    ano, mes, funcionarios, params, info, _ = escala._parametros_payload(payload)
+    meses = {m: res for tipo, m, res in escala.gerar_escala_ano_iter(
+        ano, mes, funcionarios, params, info, tentativas=6) if tipo == "mes"}
+
+    # novembro sem ciclo anterior; dezembro disputa herdado x recomeço, 3 tentativas cada
+    assert chamadas == [(6, False), (3, True), (3, False)]
+    assert "ciclo_herdado" not in meses["2026-11"]
+    assert isinstance(meses["2026-12"]["ciclo_herdado"], bool)
@@ -0,0 +1,45 @@
+import pytest
+
+import main as escala
+from benchmarks.payload import gerar_payload
+
+
+def _mes(seed, processos=1, tentativas=40, **parametros):
+    payload = gerar_payload(n_operadores=16, densidade_ferias=0.2, densidade_restricoes=0.6,
+                            seed=seed, quantidade_escalas=tentativas, **parametros)
+    ano, mes, funcionarios, params, info, kw = escala._parametros_payload(payload)
+    funcionarios = [f for f in funcionarios if f["perfil"] in ("EXP", "AUX")]
+    return escala.motor_gerar_dias_mes(ano, mes, funcionarios, params, info, FLEXIBILIZAR=kw["FLEXIBILIZAR"],
+                                       tentativas=kw["tentativas"], processos=processos)
+
+
+def _vencedora(res):
+    return res["escala"].dados.tolist(), res["score"], res["horas"], res["estado_final"]
+
+
+@pytest.mark.parametrize("motor", ["classico", "vetorizado"])
+def test_resultado_nao_depende_de_processos(motor):
+    serial = _mes(3, processos=1, motor=motor)
+    paralelo = _mes(3, processos=2, motor=motor)
+    assert _vencedora(paralelo) == _vencedora(serial)
+    assert paralelo["tentativas_realizadas"] == serial["tentativas_realizadas"]
+
+
+@pytest.mark.parametrize("seed", [3, 6])
+def test_poda_nao_muda_a_vencedora(seed):
+    com_poda = _mes(seed, tentativas=200)
+    sem_poda = _mes(seed, tentativas=200, poda=False)
+    assert com_poda["podas"]["total"] > 0
+    assert sem_poda["podas"]["total"] == 0
+    assert _vencedora(com_poda) == _vencedora(sem_poda)
+
+
+def test_parada_adaptativa_igual_a_rodada_fixa():
+    adaptativo = _mes(4, tentativas=400, parada_adaptativa={"janela": 30})
+    parou_em = adaptativo["convergencia"]["parou_em"]
+    assert parou_em < 400
+
+    fixo = _mes(4, tentativas=parou_em)
+    assert _vencedora(adaptativo) == _vencedora(fixo)
+    assert _vencedora(_mes(4, processos=2, tentativas=400, parada_adaptativa={"janela": 30})) == \
+        _vencedora(adaptativo)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import main as escala
+from benchmarks.payload import gerar_payload
+
+
+def _mes(seed, **parametros):
+    payload = gerar_payload(n_operadores=16, densidade_ferias=0.2, densidade_restricoes=0.6,
+                            seed=seed, quantidade_escalas=20, **parametros)
+    ano, mes, funcionarios, params, info, kw = escala._parametros_payload(payload)
+    funcionarios = [f for f in funcionarios if f["perfil"] in ("EXP", "AUX")]
+    res = escala.motor_gerar_dias_mes(ano, mes, funcionarios, params, info,
+                                      FLEXIBILIZAR=kw["FLEXIBILIZAR"], tentativas=kw["tentativas"])
+    return res, escala.disponibilidade_mes(funcionarios, info, ano, mes)
+
+
+@pytest.mark.parametrize("seed", [3, 4, 6, 9, 10])
+def test_otimizacao_local_nao_aloca_em_celula_indisponivel(seed):
+    res, (livre, ferias) = _mes(seed, otimizacao_local=20000)
+    assert sum(res["otimizacao_local"]["aceitos"].values()) > 0
+
+    dados = res["escala"].dados
+    for d, t, v in zip(*np.nonzero(dados >= 0)):
+        i = int(dados[d, t, v])
+        assert livre[i][d][t] and not ferias[i][d], (d, escala.TURNOS[t], i)
+
+
+def test_entradas_disponiveis_barra_ferias_e_turno_proibido():
+    livre = [[[True, False]], [[True, True]]]
+    ferias = [[False], [True]]
+    assert escala._entradas_disponiveis([(0, 0, 1, 0)], livre, ferias)
+    assert not escala._entradas_disponiveis([(0, 1, 1, 0)], livre, ferias)
+    assert not escala._entradas_disponiveis([(0, 0, 0, 1)], livre, ferias)
+
+
+def _seqs(grade, n, n_dias):
+    seq = [[escala.SEM_TURNO] * n_dias for _ in range(n)]
+    for d, linha in enumerate(grade):
+        for t, ops in enumerate(linha):
+            for i in ops:
+                seq[i][d] = t
+    return seq
+
+
+@pytest.mark.parametrize("seed", [3, 4, 6, 9, 10])
+def test_otimizacao_local_nao_piora_nenhuma_regra(seed, monkeypatch):
+    # seed 6, operador 2: {ciclo: 1, troca_de_turno_sem_folga: 1} virava
+    # {troca_de_turno_sem_folga: 2} com a comparação pelo total
+    original, pares = escala._otimizar_local, []
+
+    def espiao(ctx, grade, *args):
+        saida = original(ctx, grade, *args)
+        pares.append((ctx, grade, saida[0]))
+        return saida
+
+    monkeypatch.setattr(escala, "_otimizar_local", espiao)
+    res, _ = _mes(seed, otimizacao_local=20000)
+    assert sum(res["otimizacao_local"]["aceitos"].values()) > 0
+
+    (ctx, antes, depois), = pares
+    n, n_dias, ferias = len(ctx["fids"]), ctx["dias_no_mes"], ctx["ferias"]
+    for i, (sa, sd) in enumerate(zip(_seqs(antes, n, n_dias), _seqs(depois, n, n_dias))):
+        va = escala._violacoes_operador(sa, ferias[i])
+        vd = escala._violacoes_operador(sd, ferias[i])
+        assert not escala._piorou(va, vd), (i, dict(va), dict(vd))
+
+
+def test_violacoes_operador_conta_janela_inicial():
+    ferias = [False] * 10
+    seq = [0] * (escala.MAX_SEQ_START_WINDOW + 1) + [escala.SEM_TURNO] * 5
+    assert escala._violacoes_operador(seq, ferias)["dias_consecutivos"] == 1
+    assert not escala._violacoes_operador(seq[1:] + [escala.SEM_TURNO], ferias)["dias_consecutivos"]
@@ -0,0 +1,90 @@
+import random
+import statistics
+
+import numpy as np
+import pytest
+
+import main as escala
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_delta_score_igual_a_recontar(seed):
+    rng = random.Random(seed)
+    n = rng.randint(2, 30)
+    fids = [str(i) for i in range(n)]
+    horas = {fid: escala.HORAS_POR_TURNO * rng.randint(0, 30) for fid in fids}
+    pont = escala.PontuadorIncremental(fids, horas)
+    h = [horas[fid] for fid in fids]
+
+    for _ in range(300):
+        # movimentos da otimização local: horas passam de um operador a outro
+        mudancas = {}
+        for _ in range(rng.randint(1, 3)):
+            i = rng.randrange(n)
+            mudancas[i] = mudancas.get(i, 0) + escala.HORAS_POR_TURNO * rng.randint(-4, 4)
+        depois = list(h)
+        for i, dh in mudancas.items():
+            depois[i] += dh
+
+        esperado = escala._score_horas(depois) - escala._score_horas(h)
+        assert pont.delta_score(mudancas) == pytest.approx(esperado)
+
+        if rng.random() < 0.5:
+            pont.aplicar_horas(mudancas)
+            h = depois
+            assert pont.h[0].tolist() == h
+            assert pont.score() == pytest.approx(escala._score_horas(h))
+            assert pont.variancia() == pytest.approx(statistics.pvariance(h))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_custo_igual_ao_score_func(seed, monkeypatch):
+    # sem sequência em curso (consec = 0, sem último turno) o score_func só
+    # tem os termos que custo cobre; o ruído fica zerado
+    monkeypatch.setattr(escala.random, "uniform", lambda a, b: 0.0)
+    rng = random.Random(seed)
+    n = rng.randint(2, 20)
+    fids = [str(i) for i in range(n)]
+    funcs = [{"id": fid} for fid in fids]
+    horas = {fid: escala.HORAS_POR_TURNO * rng.randint(0, 200) for fid in fids}
+    dias = {fid: rng.randint(0, 25) for fid in fids}
+    por_turno = {fid: [rng.randint(0, 10) for _ in escala.TURNOS] for fid in fids}
+    semana = {fid: rng.randint(0, 6) for fid in fids}
+    parceiro_ult = {fid: rng.choice(fids) for fid in fids}
+    prefs = {fid: set(rng.sample(escala.TURNOS, rng.randint(0, 2))) for fid in fids}
+    estado = {"penalidade_start": {fid: rng.randint(0, 2) for fid in fids}}
+
+    pont = escala.PontuadorIncremental(fids, horas, dias=dias, por_turno=por_turno)
+    pont.semana[0] = [semana[fid] for fid in fids]
+    pont.parceiro_ult[0] = [fids.index(parceiro_ult[fid]) for fid in fids]
+    suave = escala._preparar_pontuacao_suave(funcs, {"preferencias": prefs}, estado)
+
+    for _ in range(20):
+        t, dia, meta = rng.randrange(4), rng.randint(1, 31), rng.randint(4, 6)
+        par = rng.randrange(n)
+        custo = pont.custo(suave, t, dia, meta, np.array([par]))[0]
+        for i, fid in enumerate(fids):
+            esperado = escala.score_func(
+                {}, funcs[i], escala.TURNOS[t], horas, {f: 0 for f in fids}, dia, prefs,
+                {}, {f: dict(zip(escala.TURNOS, por_turno[f])) for f in fids}, horas, dias,
+                parceiro_ult=parceiro_ult, parceiro_atual=fids[par], estado_continuo=estado,
+                dias_semana={f: {"w": semana[f]} for f in fids}, week_id="w", meta_semana=meta)
+            assert custo[i] == pytest.approx(esperado), (fid, escala.TURNOS[t], dia)
+
+
+def test_agregados_acompanham_a_escolha():
+    fids = ["a", "b", "c"]
+    pont = escala.PontuadorIncremental(fids, {"a": 12, "b": 0, "c": 24}, tentativas=2)
+    pont.atribuir(np.array([0, 1]), np.array([1, 2]), 3)
+    pont.parear(np.array([0]), np.array([1]), np.array([0]))
+    pont.fechar_dia(np.array([[False, True, False], [False, False, True]]))
+
+    assert pont.por_turno[:, :, 3].tolist() == [[0, 1, 0], [0, 0, 1]]
+    assert pont.total_turnos.tolist() == [[0, 1, 0], [0, 0, 1]]
+    H = escala.HORAS_POR_TURNO
+    assert pont.h.tolist() == [[12, H, 24], [12, 0, 24 + H]]
+    assert pont.parceiro_ult[0].tolist() == [1, 0, -1]
+    assert pont.semana.tolist() == pont.dias_mes.tolist() == [[0, 1, 0], [0, 0, 1]]
+    for a in range(2):
+        assert pont.score(a) == pytest.approx(escala._score_horas(pont.h[a].tolist()))
+        assert pont.variancia(a) == pytest.approx(statistics.pvariance(pont.h[a].tolist()))
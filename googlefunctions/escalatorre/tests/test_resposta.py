@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+import main as escala
+
+
+class _Requisicao:
+    def __init__(self, payload, headers=None):
+        self.method, self.args, self.headers = "POST", {}, headers or {}
+        self._payload = payload
+
+    def get_json(self, force=False, silent=False):
+        return json.loads(json.dumps(self._payload))
+
+
+def _payload(tipo="mes", mes_inicio=2, **parametros):
+    funcionarios = [{"id": i, "nome": f"OP{i:02d}", "perfil": "EXP" if i % 2 else "AUX"} for i in range(1, 11)]
+    return {"ano": 2026, "mes_inicio": mes_inicio, "tipo": tipo, "funcionarios": funcionarios,
+            "ferias": [{"funcionario_id": 3, "data_inicio": "2026-02-10", "data_fim": "2026-02-20"}],
+            "restricoes": [{"funcionario_id": 5, "tipo": "TURNO_PROIBIDO", "turno": "00H"}],
+            "parametros": {"seed": 7, "quantidade_escalas": 8, **parametros}}
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = escala.CacheResultados(diretorio=str(tmp_path))
+    monkeypatch.setattr(escala, "_CACHE", cache)
+    return cache
+
+
+def test_cache_devolve_o_corpo_guardado_byte_a_byte(cache, monkeypatch):
+    corpo, status, headers = escala.main(_Requisicao(_payload()))
+    assert status == 200 and headers["X-Cache"] == "MISS"
+
+    def motor_nao_deve_rodar(*args, **kw):
+        raise AssertionError("acerto de cache chamou o motor")
+
+    monkeypatch.setattr(escala, "gerar_do_payload", motor_nao_deve_rodar)
+    memoria, _, headers = escala.main(_Requisicao(_payload()))
+    assert headers["X-Cache"] == "HIT-MEMORIA"
+    assert memoria == corpo
+
+    cache.memoria.clear()
+    disco, _, headers = escala.main(_Requisicao(_payload()))
+    assert headers["X-Cache"] == "HIT-DISCO"
+    assert disco == corpo
+
+
+@pytest.mark.parametrize("tipo, mes_inicio", [("mes", 2), ("ano", 11)])
+def test_formato_compacto_volta_ao_verboso(tipo, mes_inicio):
+    verboso = escala.gerar_do_payload(_payload(tipo, mes_inicio))
+    compacto = escala.gerar_do_payload(_payload(tipo, mes_inicio, formato="compacto"))
+    assert compacto["formato"] == "compacto"
+    # pelo fio: o cliente recebe JSON, não os objetos do motor
+    compacto = json.loads(json.dumps(compacto))
+    assert escala.descompactar_escala(compacto) == json.loads(json.dumps(verboso))
+
+
+def test_feixe_deterministico():
+    def ano(processos):
+        payload = _payload("ano", 10, feixe={"largura": 2, "alternativas": 2}, processos=processos)
+        return json.dumps(escala.gerar_do_payload(payload), sort_keys=True)
+
+    serial = ano(1)
+    assert json.loads(serial)["resumo_anual"]["feixe"]["cadeias_avaliadas"] > 2
+    assert ano(1) == serial
+    assert ano(2) == serial